@@ -5,6 +5,12 @@ import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import sqlite3
 import os
+import live_monitor
+import ingest
+import end_use
+import tips
+import goals
+import features
 
 # 페이지 설정
 st.set_page_config(layout="wide")
@@ -22,6 +28,8 @@ def init_db():
         # water_usage 테이블 생성
         c.execute('''CREATE TABLE IF NOT EXISTS water_usage
                      (timestamp TEXT, usage REAL)''')
+        # meter_id 열과 인덱스 (이전 버전 DB 이전 포함)
+        ingest.ensure_schema(conn)
         
         # user_info 테이블 생성
         c.execute('''CREATE TABLE IF NOT EXISTS user_info
@@ -65,43 +73,26 @@ except sqlite3.Error as e:
 
 # 1. 실시간 물 사용량 모니터링
 st.header('1. 실시간 물 사용량 모니터링')
+live = st.checkbox('실시간 모드 (자동 갱신)', value=False)
 col1, col2 = st.columns(2)
 
 with col1:
-    # 시간대별 사용량
-    query = """
-    SELECT strftime('%H', timestamp) as hour, AVG(usage) as avg_usage
-    FROM water_usage
-    WHERE timestamp >= datetime('now', '-1 day')
-    GROUP BY hour
-    ORDER BY hour
-    """
-    try:
-        hourly_data = pd.read_sql_query(query, conn)
-        fig = go.Figure(data=go.Bar(x=hourly_data['hour'], y=hourly_data['avg_usage']))
-        fig.update_layout(title='시간대별 평균 물 사용량 (최근 24시간)', xaxis_title='시간', yaxis_title='사용량 (L)')
-        st.plotly_chart(fig)
-    except Exception as e:
-        st.error(f"데이터 조회 중 오류 발생: {str(e)}")
-        st.error(f"현재 작업 디렉토리: {os.getcwd()}")
-        st.error(f"데이터베이스 파일 존재 여부: {os.path.exists(DB_FILE)}")
+    if live:
+        # 라이브 모드: 차트 fragment만 주기적으로 갱신
+        live_monitor.live_hourly_chart(DB_FILE)
+    else:
+        # 시간대별 사용량 (공유 링 버퍼에서 집계)
+        try:
+            st.plotly_chart(live_monitor.hourly_figure(DB_FILE))
+        except Exception as e:
+            st.error(f"데이터 조회 중 오류 발생: {str(e)}")
+            st.error(f"현재 작업 디렉토리: {os.getcwd()}")
+            st.error(f"데이터베이스 파일 존재 여부: {os.path.exists(DB_FILE)}")
 
 with col2:
-    # 요일별 사용량
-    query = """
-    SELECT strftime('%w', timestamp) as day, AVG(usage) as avg_usage
-    FROM water_usage
-    WHERE timestamp >= datetime('now', '-7 days')
-    GROUP BY day
-    ORDER BY day
-    """
+    # 요일별 사용량 (공유 링 버퍼에서 집계)
     try:
-        daily_data = pd.read_sql_query(query, conn)
-        days = ['일', '월', '화', '수', '목', '금', '토']
-        daily_data['day'] = daily_data['day'].apply(lambda x: days[int(x)])
-        fig = go.Figure(data=go.Bar(x=daily_data['day'], y=daily_data['avg_usage']))
-        fig.update_layout(title='요일별 평균 물 사용량 (최근 7일)', xaxis_title='요일', yaxis_title='사용량 (L)')
-        st.plotly_chart(fig)
+        st.plotly_chart(live_monitor.weekday_figure(DB_FILE))
     except Exception as e:
         st.error(f"데이터 조회 중 오류 발생: {str(e)}")
 
@@ -111,19 +102,15 @@ col1, col2 = st.columns(2)
 
 with col1:
     st.subheader('개인 맞춤형 분석')
-    query = """
-    SELECT 
-        AVG(CASE WHEN strftime('%w', timestamp) IN ('0', '6') THEN usage ELSE NULL END) as weekend_avg,
-        AVG(CASE WHEN strftime('%w', timestamp) NOT IN ('0', '6') THEN usage ELSE NULL END) as weekday_avg
-    FROM water_usage
-    WHERE timestamp >= datetime('now', '-30 days')
-    """
     try:
-        usage_data = pd.read_sql_query(query, conn).iloc[0]
-        st.write(f"- 주중 평균: {usage_data['weekday_avg']:.2f}L/시간")
-        st.write(f"- 주말 평균: {usage_data['weekend_avg']:.2f}L/시간")
-        st.write("- 샤워 사용량: 전체의 40% (추정)")
-        st.write("- 세탁 사용량: 전체의 20% (추정)")
+        # 야간 배치로 계산해 둔 가구 특성을 키 조회 한 번으로 읽음
+        usage_data = features.household_features(conn, db_file=DB_FILE)
+        for line in features.describe_features(usage_data) or ["사용 패턴: 분석할 데이터가 아직 부족합니다."]:
+            st.write(f"- {line}")
+        # 용도별 분해 결과 테이블에서 실제 비율을 읽음
+        shares = end_use.end_use_shares(conn)
+        for line in end_use.describe_shares(shares) or ["용도별 사용량: 분석할 데이터가 아직 부족합니다."]:
+            st.write(f"- {line}")
     except Exception as e:
         st.error(f"데이터 분석 중 오류 발생: {str(e)}")
 
@@ -139,34 +126,48 @@ with col2:
 
 # 3. 게이미피케이션 요소
 st.header('3. 게이미피케이션 요소')
+# 목표/챌린지/알림은 goals 스케줄러가 미리 평가해 둔 결과를 읽음
+status = goals.goal_status(conn)
+notifications = goals.recent_notifications(conn)
+for _, kind, message, created in notifications:
+    (st.warning if kind in ('goal_exceeded', 'usage_spike') else st.info)(f'{message} ({created})')
+if notifications and st.button('알림 모두 읽음'):
+    goals.mark_read(conn)
 col1, col2, col3 = st.columns(3)
 
 with col1:
     st.subheader('일일 목표')
     try:
         cursor = conn.cursor()
-        cursor.execute("SELECT value FROM user_info WHERE key='daily_goal'")
-        daily_goal = float(cursor.fetchone()[0])
-        
-        query = """
-        SELECT SUM(usage) as total_usage
-        FROM water_usage
-        WHERE timestamp >= datetime('now', 'start of day')
-        """
-        today_usage = pd.read_sql_query(query, conn).iloc[0]['total_usage']
+        if status:
+            daily_goal = status['daily_goal']
+            today_usage = status['today_usage']
+        else:
+            # 스케줄러가 아직 실행되지 않았으면 직접 계산
+            cursor.execute("SELECT value FROM user_info WHERE key='daily_goal'")
+            daily_goal = float(cursor.fetchone()[0])
+            # 오늘 사용량은 공유 링 버퍼에서 바로 합산
+            today_usage = live_monitor.today_usage(DB_FILE)
         
         progress = min(100, (today_usage / daily_goal) * 100)
-        st.progress(progress)
-        st.write(f'목표의 {progress:.1f}%를 사용했습니다. (목표: {daily_goal}L)')
+        st.progress(int(progress))
+        st.write(f'목표의 {progress:.1f}%를 사용했습니다. (목표: {daily_goal:g}L)')
+        if status:
+            st.caption(f"평가 시각: {status['updated']}")
     except Exception as e:
         st.error(f"일일 목표 계산 중 오류 발생: {str(e)}")
 
 with col2:
     st.subheader('주간 챌린지')
     try:
-        cursor.execute("SELECT value FROM user_info WHERE key='weekly_challenge'")
-        challenge = cursor.fetchone()[0]
+        if status:
+            challenge = status['challenge']
+        else:
+            cursor.execute("SELECT value FROM user_info WHERE key='weekly_challenge'")
+            challenge = cursor.fetchone()[0]
         st.write(f'이번 주 챌린지: {challenge}')
+        if status and status['reduction_pct'] is not None:
+            st.write(f"지난주 같은 기간 대비 {status['reduction_pct']:.0f}% 절감 (목표 {status['challenge_pct']:.0f}%)")
         st.write('현재 순위: 지역 내 상위 10%')
     except Exception as e:
         st.error(f"주간 챌린지 정보 조회 중 오류 발생: {str(e)}")
@@ -177,9 +178,9 @@ with col3:
         query = """
         SELECT SUM(usage) as total_usage
         FROM water_usage
-        WHERE timestamp >= datetime('now', '-30 days')
+        WHERE meter_id = ? AND timestamp >= datetime('now', 'localtime', '-30 days')
         """
-        last_month_usage = pd.read_sql_query(query, conn).iloc[0]['total_usage']
+        last_month_usage = pd.read_sql_query(query, conn, params=(ingest.DEFAULT_METER,)).iloc[0]['total_usage']
         average_monthly_usage = 6000  # 가정: 평균 월간 사용량
         saved_water = max(0, average_monthly_usage - last_month_usage)
         trees_saved = int(saved_water / 100)
@@ -193,10 +194,8 @@ st.header('4. 커뮤니티 기능')
 col1, col2 = st.columns(2)
 
 with col1:
-    st.subheader('물 절약 팁 공유')
-    tip = st.text_area('물 절약 팁을 공유해주세요:')
-    if st.button('공유하기'):
-        st.success('팁이 공유되었습니다. 감사합니다!')
+    # 팁 저장/전문 검색/인기 팁
+    tips.tip_board(DB_FILE)
 
 with col2:
     st.subheader('지역 물 절약 현황')
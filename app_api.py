@@ -9,16 +9,32 @@ from anthropic import Anthropic, HUMAN_PROMPT, AI_PROMPT
 import asyncio
 import json
 from deep_translator import GoogleTranslator
+import httpx
+import llm_client
+import ingest
+import live_monitor
+import tips
+import goals
+import impact_sim
+import end_use
+import features
 
 
 # 페이지 설정
 st.set_page_config(layout="wide")
 st.title('워터세이브(WaterSave) 앱')
 
+# Claude 클라이언트 (API 키별로 한 번만 생성해 커넥션 풀을 재실행 간에 재사용)
+# 재시도는 llm_client 전송 계층이 담당하므로 SDK 자체 재시도는 끈다
+@st.cache_resource
+def get_client(api_key):
+    timeout = httpx.Timeout(llm_client.READ_TIMEOUT, connect=llm_client.CONNECT_TIMEOUT)
+    return Anthropic(api_key=api_key, base_url=llm_client.API_BASE_URL, timeout=timeout, max_retries=0)
+
 # API 키 입력
 api_key = st.sidebar.text_input("Claude API 키를 입력하세요:", type="password")
 if api_key:
-    client = Anthropic(api_key=api_key)
+    client = get_client(api_key)
 else:
     st.sidebar.warning("API 키를 입력해주세요.")
     client = None
@@ -34,6 +50,8 @@ def init_db():
     # water_usage 테이블 생성
     c.execute('''CREATE TABLE IF NOT EXISTS water_usage
                  (timestamp TEXT, usage REAL)''')
+    # meter_id 열과 인덱스 (이전 버전 DB 이전 포함)
+    ingest.ensure_schema(conn)
     
     # user_info 테이블 생성
     c.execute('''CREATE TABLE IF NOT EXISTS user_info
@@ -68,64 +86,46 @@ def claude_assistant(prompt):
         return "API 키를 입력해주세요."
     
     try:
-        response = client.completions.create(
+        response = llm_client.get_transport().call(lambda: client.completions.create(
             model="claude-2",
             max_tokens_to_sample=150,
             prompt=f"{HUMAN_PROMPT} {prompt}{AI_PROMPT}",
-        )
+            timeout=client.timeout,  # create()의 기본값(600초)이 클라이언트 타임아웃을 덮어쓰지 않도록
+        ))
+        llm_client.remember_completion(prompt, response.completion)
         return response.completion
+    except llm_client.LLMUnavailable:
+        return llm_client.cached_completion(prompt)
     except Exception as e:
         return f"오류가 발생했습니다: {str(e)}"
 
 # 메인 대시보드
 def main_dashboard():
     st.header('실시간 물 사용량 모니터링')
+    live = st.checkbox('실시간 모드 (자동 갱신)', value=False)
     col1, col2 = st.columns(2)
 
     with col1:
-        # 시간대별 사용량
-        query = """
-        SELECT strftime('%H', timestamp) as hour, AVG(usage) as avg_usage
-        FROM water_usage
-        WHERE timestamp >= datetime('now', '-1 day')
-        GROUP BY hour
-        ORDER BY hour
-        """
-        hourly_data = pd.read_sql_query(query, conn)
-        fig = go.Figure(data=go.Bar(x=hourly_data['hour'], y=hourly_data['avg_usage']))
-        fig.update_layout(title='시간대별 평균 물 사용량 (최근 24시간)', xaxis_title='시간', yaxis_title='사용량 (L)')
-        st.plotly_chart(fig)
+        if live:
+            # 라이브 모드: 차트 fragment만 주기적으로 갱신
+            live_monitor.live_hourly_chart(DB_FILE)
+        else:
+            # 시간대별 사용량 (공유 링 버퍼에서 집계)
+            st.plotly_chart(live_monitor.hourly_figure(DB_FILE))
 
     with col2:
-        # 요일별 사용량
-        query = """
-        SELECT strftime('%w', timestamp) as day, AVG(usage) as avg_usage
-        FROM water_usage
-        WHERE timestamp >= datetime('now', '-7 days')
-        GROUP BY day
-        ORDER BY day
-        """
-        daily_data = pd.read_sql_query(query, conn)
-        days = ['일', '월', '화', '수', '목', '금', '토']
-        daily_data['day'] = daily_data['day'].apply(lambda x: days[int(x)])
-        fig = go.Figure(data=go.Bar(x=daily_data['day'], y=daily_data['avg_usage']))
-        fig.update_layout(title='요일별 평균 물 사용량 (최근 7일)', xaxis_title='요일', yaxis_title='사용량 (L)')
-        st.plotly_chart(fig)
+        # 요일별 사용량 (공유 링 버퍼에서 집계)
+        st.plotly_chart(live_monitor.weekday_figure(DB_FILE))
 
 # 지능형 물 절약 어시스턴트
 def intelligent_assistant():
     st.header('지능형 물 절약 어시스턴트')
     user_question = st.text_input("물 절약에 대해 질문해 주세요:")
     if user_question:
-        # 사용자의 물 사용 데이터를 가져옴
-        query = """
-        SELECT AVG(usage) as avg_usage
-        FROM water_usage
-        WHERE timestamp >= datetime('now', '-30 days')
-        """
-        avg_usage = pd.read_sql_query(query, conn).iloc[0]['avg_usage']
-        
-        prompt = f"사용자의 평균 물 사용량은 {avg_usage:.2f}L/시간입니다. 다음 질문에 답해주세요: {user_question}"
+        # 사용자의 물 사용 특성을 가져옴
+        usage_data = features.household_features(conn, db_file=DB_FILE)
+        profile = "\n".join(f"- {line}" for line in features.describe_features(usage_data))
+        prompt = f"사용자의 물 사용 패턴:\n{profile}\n\n다음 질문에 답해주세요: {user_question}"
         response = claude_assistant(prompt)
         st.write(response)
 
@@ -164,35 +164,54 @@ def intelligent_problem_solving():
 # 환경 영향 시뮬레이션
 def environmental_impact():
     st.header('환경 영향 시뮬레이션')
-    saved_water = st.number_input('절약한 물의 양 (L)', value=1000)
-    trees_saved = saved_water // 100
-    st.write(f'당신의 노력으로 {trees_saved}그루의 나무를 살렸습니다! 🌳' * min(trees_saved, 10))
-    
-    # 장기 효과 예측
+    daily_mean, daily_std = impact_sim.usage_profile(conn)
+    st.write(f"최근 {impact_sim.PROFILE_DAYS}일 일평균 사용량: {daily_mean:,.1f}L (표준편차 {daily_std:,.1f}L)")
+    rate_low, rate_high = st.slider('예상 절약률 범위 (%)', 0, 50, (5, 15))
     years = st.slider('몇 년 후의 효과를 보고 싶으신가요?', 1, 10, 5)
-    long_term_effect = saved_water * 12 * years
-    st.write(f"{years}년 후에는 총 {long_term_effect:,}L의 물을 절약할 수 있습니다!")
+
+    # 실제 사용량 분포로 5,000개 시나리오를 계산 (같은 입력은 캐시됨)
+    result = impact_sim.simulate(daily_mean, daily_std, rate_low / 100, rate_high / 100, years)
+    water = result['water_l']['percentiles']
+    energy = result['energy_kwh']['percentiles']
+    co2 = result['co2_kg']['percentiles']
+    trees_saved = int(result['trees']['percentiles'][50][-1])
+    st.write(f'당신의 노력으로 {trees_saved}그루의 나무를 살렸습니다! 🌳' * min(trees_saved, 10))
+    st.write(f"{years}년 후에는 총 {water[50][-1]:,.0f}L의 물을 절약할 수 있습니다! "
+             f"(90% 구간: {water[5][-1]:,.0f}L ~ {water[95][-1]:,.0f}L)")
+    st.write(f"- 에너지 절감: {energy[50][-1]:,.0f}kWh (90% 구간: {energy[5][-1]:,.0f} ~ {energy[95][-1]:,.0f}kWh)")
+    st.write(f"- CO2 감축: {co2[50][-1]:,.0f}kg (90% 구간: {co2[5][-1]:,.0f} ~ {co2[95][-1]:,.0f}kg)")
+
+    fig = go.Figure([
+        go.Scatter(x=result['years'], y=water[95], line=dict(width=0), showlegend=False),
+        go.Scatter(x=result['years'], y=water[5], fill='tonexty', line=dict(width=0), name='90% 구간'),
+        go.Scatter(x=result['years'], y=water[50], name='중앙값'),
+    ])
+    fig.update_layout(title='누적 물 절약량 시뮬레이션', xaxis_title='년', yaxis_title='절약량 (L)')
+    st.plotly_chart(fig)
 
 # 5. 환경 영향 시각화
 def environmental_visual():
     st.header('5. 환경 영향 시각화')
+    daily_mean, daily_std = impact_sim.usage_profile(conn)
+    # 최근 사용량 기준 10% 안팎 절약 시 1년 효과 (중앙값)
+    result = impact_sim.simulate(daily_mean, daily_std, 0.05, 0.15, 1)
     col1, col2 = st.columns(2)
 
     with col1:
         st.subheader('CO2 감축량')
-        co2_reduced = st.number_input('물 절약으로 인한 CO2 감축량 (kg)', value=50)
+        co2_reduced = result['co2_kg']['percentiles'][50][-1]
         fig = go.Figure(go.Indicator(
             mode = "gauge+number",
             value = co2_reduced,
             domain = {'x': [0, 1], 'y': [0, 1]},
-            title = {'text': "CO2 감축량 (kg)"}))
+            title = {'text': "연간 CO2 감축량 (kg)"}))
         st.plotly_chart(fig)
 
     with col2:
         st.subheader('지역 수자원 영향')
-        water_saved = st.number_input('절약한 물의 양 (L)', value=1000)
-        st.write(f'당신의 노력으로 {water_saved}L의 물을 절약했습니다.')
-        st.write(f'이는 {water_saved // 2}명의 하루 물 사용량과 같습니다.')
+        water_saved = int(result['water_l']['percentiles'][50][-1])
+        st.write(f'당신의 노력으로 1년간 {water_saved:,}L의 물을 절약할 수 있습니다.')
+        st.write(f'이는 {water_saved // 2:,}명의 하루 물 사용량과 같습니다.')
 
 # 다국어 지원 및 문화적 맥락화
 def multilingual_support():
@@ -223,19 +242,15 @@ def ai_analysis_and_recommendation():
 
     with col1:
         st.subheader('개인 맞춤형 분석')
-        query = """
-        SELECT 
-            AVG(CASE WHEN strftime('%w', timestamp) IN ('0', '6') THEN usage ELSE NULL END) as weekend_avg,
-            AVG(CASE WHEN strftime('%w', timestamp) NOT IN ('0', '6') THEN usage ELSE NULL END) as weekday_avg
-        FROM water_usage
-        WHERE timestamp >= datetime('now', '-30 days')
-        """
         try:
-            usage_data = pd.read_sql_query(query, conn).iloc[0]
-            st.write(f"- 주중 평균: {usage_data['weekday_avg']:.2f}L/시간")
-            st.write(f"- 주말 평균: {usage_data['weekend_avg']:.2f}L/시간")
-            st.write("- 샤워 사용량: 전체의 40% (추정)")
-            st.write("- 세탁 사용량: 전체의 20% (추정)")
+            # 야간 배치로 계산해 둔 가구 특성을 키 조회 한 번으로 읽음
+            usage_data = features.household_features(conn, db_file=DB_FILE)
+            for line in features.describe_features(usage_data) or ["사용 패턴: 분석할 데이터가 아직 부족합니다."]:
+                st.write(f"- {line}")
+            # 용도별 분해 결과 테이블에서 실제 비율을 읽음
+            shares = end_use.end_use_shares(conn)
+            for line in end_use.describe_shares(shares) or ["용도별 사용량: 분석할 데이터가 아직 부족합니다."]:
+                st.write(f"- {line}")
         except Exception as e:
             st.error(f"데이터 분석 중 오류 발생: {str(e)}")
 
@@ -252,34 +267,48 @@ def ai_analysis_and_recommendation():
 # 게이미피케이션 요소
 def gamification_elements():
     st.header('게이미피케이션 요소')
+    # 목표/챌린지/알림은 goals 스케줄러가 미리 평가해 둔 결과를 읽음
+    status = goals.goal_status(conn)
+    notifications = goals.recent_notifications(conn)
+    for _, kind, message, created in notifications:
+        (st.warning if kind in ('goal_exceeded', 'usage_spike') else st.info)(f'{message} ({created})')
+    if notifications and st.button('알림 모두 읽음'):
+        goals.mark_read(conn)
     col1, col2, col3 = st.columns(3)
 
     with col1:
         st.subheader('일일 목표')
         try:
             cursor = conn.cursor()
-            cursor.execute("SELECT value FROM user_info WHERE key='daily_goal'")
-            daily_goal = float(cursor.fetchone()[0])
-            
-            query = """
-            SELECT SUM(usage) as total_usage
-            FROM water_usage
-            WHERE timestamp >= datetime('now', 'start of day')
-            """
-            today_usage = pd.read_sql_query(query, conn).iloc[0]['total_usage']
+            if status:
+                daily_goal = status['daily_goal']
+                today_usage = status['today_usage']
+            else:
+                # 스케줄러가 아직 실행되지 않았으면 직접 계산
+                cursor.execute("SELECT value FROM user_info WHERE key='daily_goal'")
+                daily_goal = float(cursor.fetchone()[0])
+                # 오늘 사용량은 공유 링 버퍼에서 바로 합산
+                today_usage = live_monitor.today_usage(DB_FILE)
             
             progress = min(100, (today_usage / daily_goal) * 100)
-            st.progress(progress)
-            st.write(f'목표의 {progress:.1f}%를 사용했습니다. (목표: {daily_goal}L)')
+            st.progress(int(progress))
+            st.write(f'목표의 {progress:.1f}%를 사용했습니다. (목표: {daily_goal:g}L)')
+            if status:
+                st.caption(f"평가 시각: {status['updated']}")
         except Exception as e:
             st.error(f"일일 목표 계산 중 오류 발생: {str(e)}")
 
     with col2:
         st.subheader('주간 챌린지')
         try:
-            cursor.execute("SELECT value FROM user_info WHERE key='weekly_challenge'")
-            challenge = cursor.fetchone()[0]
+            if status:
+                challenge = status['challenge']
+            else:
+                cursor.execute("SELECT value FROM user_info WHERE key='weekly_challenge'")
+                challenge = cursor.fetchone()[0]
             st.write(f'이번 주 챌린지: {challenge}')
+            if status and status['reduction_pct'] is not None:
+                st.write(f"지난주 같은 기간 대비 {status['reduction_pct']:.0f}% 절감 (목표 {status['challenge_pct']:.0f}%)")
             st.write('현재 순위: 지역 내 상위 10%')
         except Exception as e:
             st.error(f"주간 챌린지 정보 조회 중 오류 발생: {str(e)}")
@@ -290,9 +319,9 @@ def gamification_elements():
             query = """
             SELECT SUM(usage) as total_usage
             FROM water_usage
-            WHERE timestamp >= datetime('now', '-30 days')
+            WHERE meter_id = ? AND timestamp >= datetime('now', 'localtime', '-30 days')
             """
-            last_month_usage = pd.read_sql_query(query, conn).iloc[0]['total_usage']
+            last_month_usage = pd.read_sql_query(query, conn, params=(ingest.DEFAULT_METER,)).iloc[0]['total_usage']
             average_monthly_usage = 6000  # 가정: 평균 월간 사용량
             saved_water = max(0, average_monthly_usage - last_month_usage)
             trees_saved = int(saved_water / 100)
@@ -307,10 +336,8 @@ def community_features():
     col1, col2 = st.columns(2)
 
     with col1:
-        st.subheader('물 절약 팁 공유')
-        tip = st.text_area('물 절약 팁을 공유해주세요:')
-        if st.button('공유하기'):
-            st.success('팁이 공유되었습니다. 감사합니다!')
+        # 팁 저장/전문 검색/인기 팁
+        tips.tip_board(DB_FILE)
 
     with col2:
         st.subheader('지역 물 절약 현황')
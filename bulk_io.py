@@ -0,0 +1,208 @@
+import argparse
+import csv
+import gzip
+import json
+import os
+import sys
+import time
+import pandas as pd
+from dateutil import tz
+
+import ingest
+
+# 측정 데이터 일괄 가져오기/내보내기
+# 계량기/수도요금 이력(CSV, JSON Lines, .gz 가능)을 청크 단위로 읽어 메모리 사용량이 파일 크기와 무관하다.
+# 타임스탬프는 청크마다 벡터화해 파싱하고, (meter_id, timestamp)가 이미 있는 행은 건너뛰며,
+# 여러 청크를 하나의 큰 트랜잭션으로 묶어 적재한다.
+# 내보내기는 커서에서 fetchmany로 읽은 행을 DataFrame 없이 바로 파일에 쓴다.
+#
+#   python bulk_io.py import utility_dump.csv.gz --meter-column account --time-column read_at --usage-column liters
+#   python bulk_io.py import readings.jsonl --meter home
+#   python bulk_io.py export backup.csv --start "2024-01-01 00:00:00"
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+CHUNK_ROWS = int(os.environ.get('BULK_CHUNK_ROWS', '200000'))
+COMMIT_ROWS = int(os.environ.get('BULK_COMMIT_ROWS', '2000000'))
+EXPORT_COLUMNS = ['meter_id', 'timestamp', 'usage']
+# 시간대가 있는 값을 변환할 로컬 시간대 (기본값은 시스템 시간대, 서머타임 이력 포함)
+LOCAL_TZ = tz.gettz(os.environ.get('BULK_LOCAL_TZ') or None)
+
+
+def detect_format(path, fmt):
+    if fmt:
+        return fmt
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'jsonl' if name.endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def read_chunks(path, fmt, columns, chunk_rows):
+    if fmt == 'jsonl':
+        return pd.read_json(path, lines=True, chunksize=chunk_rows, dtype=False)
+    return pd.read_csv(path, chunksize=chunk_rows, usecols=lambda c: c in columns, dtype=str)
+
+
+# 값 하나를 로컬 시간(시간대 없음)으로 변환
+def _to_local(value, time_format):
+    parsed = pd.to_datetime(value, format=time_format, errors='coerce')
+    if parsed is not pd.NaT and parsed.tzinfo is not None:
+        parsed = parsed.tz_convert(LOCAL_TZ).tz_localize(None)
+    return parsed
+
+
+# 타임스탬프 열을 'YYYY-MM-DD HH:MM:SS' 문자열로 변환 (파싱 실패는 NaN)
+# 여러 계량기가 같은 시각을 공유하는 경우가 많으므로 고유값만 파싱한 뒤 코드로 펼친다
+def parse_timestamps(values, time_format):
+    codes, uniques = pd.factorize(values)
+    # 형식을 지정하지 않으면 첫 값으로 추측한 형식을 전체에 쓰지 않고 값마다 판단 (고유값만 파싱하므로 저렴함)
+    time_format = time_format or 'mixed'
+    try:
+        parsed = pd.to_datetime(pd.Series(uniques), format=time_format, errors='coerce')
+    except ValueError:
+        # 오프셋이 섞인 경우 (서머타임 전후의 -05:00과 -04:00, 시간대가 없는 값과 있는 값)는 값마다 변환
+        parsed = pd.Series([_to_local(value, time_format) for value in uniques], dtype='datetime64[ns]')
+    if getattr(parsed.dt, 'tz', None) is not None:
+        # 시간대가 있는 값은 각 시각의 로컬 오프셋을 적용해 앱과 같은 로컬 시간으로 변환
+        parsed = parsed.dt.tz_convert(LOCAL_TZ).dt.tz_localize(None)
+    formatted = parsed.dt.strftime(TIME_FORMAT).to_numpy(dtype=object)
+    # 결측값(코드 -1)은 NaN
+    return pd.Series(formatted.take(codes, mode='clip'), index=values.index).where(codes >= 0)
+
+
+# 청크를 (meter_id, timestamp, usage) 행으로 정규화하고 (행 목록, 버린 행 수)를 반환
+def normalize(chunk, args):
+    timestamps = parse_timestamps(chunk[args.time_column], args.time_format)
+    usage = pd.to_numeric(chunk[args.usage_column], errors='coerce') * args.scale
+    if args.meter_column in chunk:
+        meters = chunk[args.meter_column].astype(str)
+    else:
+        meters = pd.Series(args.meter, index=chunk.index)
+
+    valid = timestamps.notna() & usage.notna() & (usage >= 0)
+    frame = pd.DataFrame({'meter_id': meters[valid], 'timestamp': timestamps[valid],
+                          'usage': usage[valid].astype(float)})
+    # 같은 청크 안의 중복은 마지막 값을 사용
+    frame = frame.drop_duplicates(['meter_id', 'timestamp'], keep='last')
+    rows = zip(frame['meter_id'].tolist(), frame['timestamp'].tolist(), frame['usage'].tolist())
+    return list(rows), int((~valid).sum())
+
+
+def run_import(args):
+    conn = ingest.connect(args.db)
+    ingest.ensure_schema(conn)
+    conn.execute(f"PRAGMA cache_size=-{args.cache_mb * 1024}")
+    fmt = detect_format(args.path, args.format)
+    columns = {args.meter_column, args.time_column, args.usage_column}
+
+    started = time.monotonic()
+    read = inserted = skipped = pending = 0
+    try:
+        for chunk in read_chunks(args.path, fmt, columns, args.chunk_rows):
+            missing = {args.time_column, args.usage_column} - set(chunk.columns)
+            if missing:
+                raise SystemExit(f"필요한 열이 없습니다: {', '.join(sorted(missing))}")
+            rows, invalid = normalize(chunk, args)
+            read += len(chunk)
+            skipped += invalid
+            inserted += ingest.insert_new_readings(conn, rows)
+            pending += len(rows)
+            if pending >= args.commit_rows:
+                conn.commit()
+                pending = 0
+            elapsed = time.monotonic() - started
+            print(f"[{elapsed:6.1f}s] 읽음 {read:,} / 적재 {inserted:,} / 중복 {read - inserted - skipped:,} / "
+                  f"오류 {skipped:,} ({read / max(elapsed, 1e-9):,.0f} rows/s)", file=sys.stderr)
+        conn.commit()
+    except BaseException:
+        # 마지막 커밋 이후의 청크만 취소됨 (다시 실행하면 중복은 건너뜀)
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    print(f"가져오기 완료: {inserted:,}건 적재, {read - inserted - skipped:,}건 중복, {skipped:,}건 오류 "
+          f"({time.monotonic() - started:.1f}초)")
+
+
+def open_output(path):
+    if path == '-':
+        return sys.stdout
+    if path.endswith('.gz'):
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def run_export(args):
+    conn = ingest.connect(args.db)
+    conditions, params = [], []
+    if args.meter:
+        conditions.append("meter_id = ?")
+        params.append(args.meter)
+    if args.start:
+        conditions.append("timestamp >= ?")
+        params.append(args.start)
+    if args.end:
+        conditions.append("timestamp < ?")
+        params.append(args.end)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    order = "ORDER BY meter_id, timestamp" if args.sorted else ''
+    cursor = conn.execute(f"SELECT meter_id, timestamp, usage FROM water_usage {where} {order}", params)
+
+    fmt = detect_format(args.path, args.format)
+    out = open_output(args.path)
+    started = time.monotonic()
+    written = 0
+    try:
+        writer = csv.writer(out) if fmt == 'csv' else None
+        if writer:
+            writer.writerow(EXPORT_COLUMNS)
+        while True:
+            rows = cursor.fetchmany(args.chunk_rows)
+            if not rows:
+                break
+            if writer:
+                writer.writerows(rows)
+            else:
+                out.writelines(json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + '\n'
+                               for row in rows)
+            written += len(rows)
+            print(f"[{time.monotonic() - started:6.1f}s] 내보냄 {written:,}", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        conn.close()
+    print(f"내보내기 완료: {written:,}건 ({time.monotonic() - started:.1f}초)", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='측정 데이터 일괄 가져오기/내보내기')
+    parser.add_argument('--db', default=ingest.DB_FILE)
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help='기본값은 확장자로 판단')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    importer = commands.add_parser('import', help='CSV/JSON Lines 파일을 water_usage로 가져오기')
+    importer.add_argument('path')
+    importer.add_argument('--meter-column', default='meter_id')
+    importer.add_argument('--time-column', default='timestamp')
+    importer.add_argument('--usage-column', default='usage')
+    importer.add_argument('--meter', default=ingest.DEFAULT_METER, help='계량기 열이 없을 때 사용할 계량기 ID')
+    importer.add_argument('--time-format', help='타임스탬프 형식 (예: %%Y%%m%%d%%H%%M), 기본값은 자동 판단')
+    importer.add_argument('--scale', type=float, default=1.0, help='사용량 단위 환산 배수 (예: m3 -> L 는 1000)')
+    importer.add_argument('--commit-rows', type=int, default=COMMIT_ROWS)
+    importer.add_argument('--cache-mb', type=int, default=256)
+
+    exporter = commands.add_parser('export', help='water_usage를 CSV/JSON Lines 파일로 내보내기')
+    exporter.add_argument('path', help="출력 파일 ('-'이면 표준 출력)")
+    exporter.add_argument('--meter')
+    exporter.add_argument('--start', help='포함, 예: 2024-01-01 00:00:00')
+    exporter.add_argument('--end', help='미포함')
+    exporter.add_argument('--sorted', action='store_true', help='계량기/시간 순으로 정렬 (인덱스 순회)')
+
+    args = parser.parse_args()
+    if args.command == 'import':
+        run_import(args)
+    else:
+        run_export(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+import argparse
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import ingest
+
+# 용도별 물 사용량 분해 (end-use disaggregation)
+# 1분 단위 유량을 사용 이벤트로 나누고 시그니처(지속 시간, 사용량, 평균 유량)로
+# 샤워/세탁기/식기세척기/변기/기타로 분류한다. 몇 시간 동안 0으로 떨어지지 않는 바닥 유량은
+# 지속 누수로 따로 집계한다. 결과는 end_use_daily 테이블에 일별/용도별로 누적되며
+# 분석 페이지는 이 테이블에서 실제 비율을 읽는다. 모든 처리는 계량기(meter_id)별로 따로 한다.
+#
+# 과거 전체는 BATCH_DAYS 단위로 벡터 연산 일괄 처리하고, 이후에는 워터마크 이후의
+# 새 측정값만 증분 처리한다. 아직 끝나지 않았을 수 있는 마지막 이벤트는 다음 실행으로 넘긴다.
+#
+#   python end_use.py --once
+#   python end_use.py --interval 300
+
+DB_FILE = os.environ.get('DB_FILE', 'water_usage.db')
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+BATCH_DAYS = 7
+ACTIVE_FLOW = 0.5          # L/분, 바닥 유량을 뺀 뒤 이보다 크면 사용 중으로 봄
+GAP_MINUTES = 2            # 이 시간 이하로 끊긴 사용은 같은 이벤트로 묶음
+LEAK_WINDOW = '360min'     # 이 기간 내내 유량이 있으면 그 최솟값을 지속 누수로 봄
+LEAK_MIN_FLOW = 0.05       # L/분
+LEAK_MIN_PERIODS = 300
+
+# 분류 규칙 (위에서부터 먼저 일치하는 용도로 분류, 범위는 [min, max])
+SIGNATURES = [
+    # 이름,        지속 시간(분), 사용량(L),   평균 유량(L/분)
+    ('toilet',     (1, 3),      (4, 15),     (2, 15)),
+    ('shower',     (4, 25),     (20, 300),   (5, 13)),
+    ('washer',     (10, 90),    (40, 200),   (1, 10)),
+    ('dishwasher', (20, 150),   (8, 40),     (0, 1.5)),
+]
+
+END_USE_LABELS = {
+    'shower': '샤워',
+    'washer': '세탁',
+    'dishwasher': '식기세척기',
+    'toilet': '변기',
+    'leak': '지속 누수',
+    'other': '기타',
+}
+
+
+DAILY_SCHEMA = '''CREATE TABLE IF NOT EXISTS {table}
+                  (meter_id TEXT, day TEXT, end_use TEXT, volume REAL, events INTEGER,
+                   PRIMARY KEY (meter_id, day, end_use))'''
+
+
+def ensure_schema(conn):
+    ingest.ensure_schema(conn)
+    conn.execute('''CREATE TABLE IF NOT EXISTS end_use_events
+                    (start TEXT, end TEXT, end_use TEXT, volume REAL, duration INTEGER, peak REAL)''')
+    if 'meter_id' not in ingest._columns(conn, 'end_use_events'):
+        conn.execute(f"ALTER TABLE end_use_events ADD COLUMN meter_id TEXT NOT NULL DEFAULT '{ingest.DEFAULT_METER}'")
+    conn.execute("DROP INDEX IF EXISTS idx_end_use_events_start")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_end_use_events_meter_start ON end_use_events (meter_id, start)")
+    ingest.ensure_meter_keyed(conn, 'end_use_daily', DAILY_SCHEMA)
+    conn.execute('''CREATE TABLE IF NOT EXISTS end_use_watermarks
+                    (meter_id TEXT PRIMARY KEY, watermark TEXT)''')
+    # 이전 버전의 단일 워터마크를 기본 계량기 워터마크로 이전
+    conn.execute('''CREATE TABLE IF NOT EXISTS user_info
+                    (key TEXT PRIMARY KEY, value TEXT)''')
+    conn.execute("""INSERT OR IGNORE INTO end_use_watermarks (meter_id, watermark)
+                    SELECT ?, value FROM user_info WHERE key='end_use_watermark'""", (ingest.DEFAULT_METER,))
+    conn.execute("DELETE FROM user_info WHERE key='end_use_watermark'")
+    conn.commit()
+
+
+# 이벤트 분할 및 분류 (모두 벡터 연산)
+def detect_events(minutes, flow):
+    active = np.flatnonzero(flow > ACTIVE_FLOW)
+    if len(active) == 0:
+        return pd.DataFrame(columns=['start', 'end', 'end_use', 'volume', 'duration', 'peak'])
+
+    # 사용 중인 분 사이 간격이 GAP_MINUTES를 넘으면 새 이벤트
+    breaks = np.flatnonzero(np.diff(minutes[active]) > GAP_MINUTES + 1) + 1
+    starts = np.concatenate(([0], breaks))
+    ends = np.concatenate((breaks, [len(active)])) - 1
+
+    values = flow[active]
+    volume = np.add.reduceat(values, starts)
+    peak = np.maximum.reduceat(values, starts)
+    active_minutes = ends - starts + 1
+    duration = minutes[active[ends]] - minutes[active[starts]] + 1
+    rate = volume / active_minutes
+
+    conditions = [
+        (duration >= d[0]) & (duration <= d[1]) & (volume >= v[0]) & (volume <= v[1]) & (rate >= r[0]) & (rate <= r[1])
+        for _, d, v, r in SIGNATURES
+    ]
+    labels = np.select(conditions, [name for name, *_ in SIGNATURES], default='other')
+
+    return pd.DataFrame({
+        'start': active[starts],
+        'end': active[ends],
+        'end_use': labels,
+        'volume': volume,
+        'duration': duration,
+        'peak': peak,
+    })
+
+
+def _get_watermark(conn, meter_id):
+    row = conn.execute("SELECT watermark FROM end_use_watermarks WHERE meter_id=?", (meter_id,)).fetchone()
+    return row[0] if row else None
+
+
+# 한 계량기에 대해 워터마크 이후 최대 BATCH_DAYS만큼 처리하고, 처리한 측정값 수를 반환
+def process_batch(conn, meter_id, batch_days=BATCH_DAYS):
+    watermark = _get_watermark(conn, meter_id)
+    if watermark is None:
+        first = conn.execute("SELECT MIN(timestamp) FROM water_usage WHERE meter_id=?", (meter_id,)).fetchone()[0]
+        if first is None:
+            return 0
+        watermark = (datetime.strptime(first, TIME_FORMAT) - timedelta(seconds=1)).strftime(TIME_FORMAT)
+    while True:
+        watermark_dt = datetime.strptime(watermark, TIME_FORMAT)
+        lookback = (watermark_dt - pd.Timedelta(LEAK_WINDOW)).strftime(TIME_FORMAT)
+        until = (watermark_dt + timedelta(days=batch_days)).strftime(TIME_FORMAT)
+
+        df = pd.read_sql_query("""SELECT timestamp, usage FROM water_usage
+                                  WHERE meter_id = ? AND timestamp > ? AND timestamp <= ?
+                                  ORDER BY timestamp""", conn, params=(meter_id, lookback, until))
+        df['timestamp'] = pd.to_datetime(df['timestamp'], format=TIME_FORMAT)
+        df = df.groupby('timestamp', sort=True)['usage'].sum()
+        is_new = df.index > watermark_dt
+        if is_new.any():
+            break
+        # 배치 기간보다 긴 공백(측정 중단, 보존 정리로 삭제된 구간, 공백이 있는 일괄 가져오기)은
+        # 다음 측정값 직전으로 건너뜀 (이후 데이터가 없으면 따라잡은 것)
+        following = conn.execute("SELECT MIN(timestamp) FROM water_usage WHERE meter_id = ? AND timestamp > ?",
+                                 (meter_id, until)).fetchone()[0]
+        if following is None:
+            return 0
+        watermark = (datetime.strptime(following, TIME_FORMAT) - timedelta(seconds=1)).strftime(TIME_FORMAT)
+
+    # 지속 누수: 일정 기간 내내 유지된 최소 유량
+    baseline = df.rolling(LEAK_WINDOW, min_periods=LEAK_MIN_PERIODS).min().fillna(0).to_numpy()
+    leak = np.where(baseline >= LEAK_MIN_FLOW, baseline, 0.0)
+    usage = df.to_numpy()
+    flow = np.clip(usage - leak, 0, None)
+
+    new_offset = int(np.argmax(is_new))
+    minutes = (df.index.to_numpy().astype('datetime64[m]').astype(np.int64))[new_offset:]
+    events = detect_events(minutes, flow[new_offset:])
+    events[['start', 'end']] += new_offset
+
+    # 마지막 측정값 근처에서 끝난 이벤트는 아직 진행 중일 수 있으므로 다음 실행으로 넘김
+    # (단, 뒤에 데이터가 더 있는데 넘기면 진행이 멈추는 경우에는 배치 경계에서 끊음)
+    last_index = len(df) - 1
+    if len(events) and minutes[-1] - minutes[events['end'].iloc[-1] - new_offset] <= GAP_MINUTES:
+        deferred_last = events['start'].iloc[-1] - 1
+        at_data_end = conn.execute("SELECT 1 FROM water_usage WHERE meter_id = ? AND timestamp > ? LIMIT 1",
+                                   (meter_id, until)).fetchone() is None
+        if deferred_last >= new_offset or at_data_end:
+            last_index = deferred_last
+            events = events.iloc[:-1]
+    if last_index < new_offset:
+        return 0
+
+    timestamps = df.index
+    days = timestamps.strftime('%Y-%m-%d')
+    daily = []
+    if len(events):
+        events['day'] = days[events['start'].to_numpy()]
+        daily.append(events.groupby(['day', 'end_use'])
+                     .agg(volume=('volume', 'sum'), events=('volume', 'size')).reset_index())
+    leak_slice = slice(new_offset, last_index + 1)
+    leak_daily = pd.DataFrame({'day': days[leak_slice], 'volume': leak[leak_slice]})
+    leak_daily = leak_daily[leak_daily['volume'] > 0].groupby('day')['volume'].sum().reset_index()
+    if len(leak_daily):
+        leak_daily['end_use'] = 'leak'
+        leak_daily['events'] = 0
+        daily.append(leak_daily)
+
+    new_watermark = timestamps[last_index].strftime(TIME_FORMAT)
+    with conn:
+        if len(events):
+            conn.executemany('''INSERT INTO end_use_events (meter_id, start, end, end_use, volume, duration, peak)
+                                 VALUES (?, ?, ?, ?, ?, ?, ?)''', zip(
+                [meter_id] * len(events),
+                timestamps[events['start'].to_numpy()].strftime(TIME_FORMAT),
+                timestamps[events['end'].to_numpy()].strftime(TIME_FORMAT),
+                events['end_use'], events['volume'].astype(float), events['duration'].astype(int),
+                events['peak'].astype(float)))
+        for frame in daily:
+            frame['meter_id'] = meter_id
+            conn.executemany('''INSERT INTO end_use_daily (meter_id, day, end_use, volume, events)
+                                VALUES (?, ?, ?, ?, ?)
+                                ON CONFLICT(meter_id, day, end_use) DO UPDATE SET
+                                    volume = volume + excluded.volume,
+                                    events = events + excluded.events''',
+                             frame[['meter_id', 'day', 'end_use', 'volume', 'events']].itertuples(index=False, name=None))
+        conn.execute("INSERT OR REPLACE INTO end_use_watermarks (meter_id, watermark) VALUES (?, ?)",
+                     (meter_id, new_watermark))
+    return last_index - new_offset + 1
+
+
+# 모든 계량기의 워터마크가 최신 데이터를 따라잡을 때까지 반복 처리
+def run(conn, batch_days=BATCH_DAYS):
+    ensure_schema(conn)
+    total = 0
+    for meter_id in ingest.meter_ids(conn):
+        while True:
+            processed = process_batch(conn, meter_id, batch_days)
+            total += processed
+            if processed == 0:
+                break
+    return total
+
+
+# 최근 days일 동안의 용도별 비율 ({용도: 비율}), 데이터가 없으면 빈 dict
+# 화면에서 매번 호출되므로 읽기만 한다 (스키마 이전은 run()에서)
+def end_use_shares(conn, meter_id=ingest.DEFAULT_METER, days=30):
+    try:
+        rows = conn.execute("""SELECT end_use, SUM(volume) FROM end_use_daily
+                               WHERE meter_id = ? AND day >= date('now', 'localtime', ?)
+                               GROUP BY end_use ORDER BY SUM(volume) DESC""", (meter_id, f'-{days} days')).fetchall()
+    except sqlite3.OperationalError:
+        # 분해 작업이 아직 한 번도 실행되지 않았거나 이전 스키마인 경우
+        return {}
+    total = sum(volume for _, volume in rows)
+    if not total:
+        return {}
+    return {end_use: volume / total for end_use, volume in rows}
+
+
+
+# 화면/프롬프트용 문장 목록 (예: "샤워 사용량: 전체의 40%")
+def describe_shares(shares):
+    return [f"{END_USE_LABELS.get(name, name)} 사용량: 전체의 {share:.0%}" for name, share in shares.items()]
+
+
+def _tick(conn):
+    print(f"End-use processed: {run(conn)}")
+
+
+def run_forever(db_file=DB_FILE, interval=300, stop_event=None):
+    ingest.run_periodically(_tick, db_file, interval, stop_event, label='용도별 분해')
+
+
+def start_background_disaggregation(db_file=DB_FILE, interval=300):
+    return ingest.start_periodic_thread(_tick, db_file, interval, label='용도별 분해')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='용도별 물 사용량 분해')
+    parser.add_argument('--db', default=DB_FILE)
+    parser.add_argument('--once', action='store_true')
+    parser.add_argument('--interval', type=int, default=300)
+    args = parser.parse_args()
+
+    if args.once:
+        conn = ingest.connect(args.db)
+        print(run(conn))
+        print(end_use_shares(conn))
+        conn.close()
+    else:
+        run_forever(args.db, args.interval)
+
+
+if __name__ == '__main__':
+    main()
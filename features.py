@@ -0,0 +1,238 @@
+import argparse
+import multiprocessing as mp
+import os
+import sqlite3
+import time
+import warnings
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import goals
+import ingest
+
+# 가구별 특성 저장소
+# 분석 페이지와 LLM 프롬프트가 매번 SQL로 계산하던 사용 패턴 특성을 야간 배치로 미리 계산한다.
+# - 최근 WINDOW_DAYS일(오늘 제외)을 계량기 CHUNK_METERS개씩 나누어 프로세스 풀에서 계산
+#   (모든 특성이 시간별 합계에서 나오므로 SQLite에서 시간 단위로 집계해 읽음: 계량기당 최대 720행)
+# - 계량기마다 고정 길이 float32 벡터(FEATURE_NAMES 순서)를 household_features에 BLOB으로 저장하고
+#   벡터 구성이 바뀌면 FEATURE_VERSION을 올린다
+# - 페이지는 household_features()로 키 조회 한 번에 읽는다 (없거나 오래되면 그 계량기만 즉시 계산)
+#
+#   python features.py --once --processes 4
+#   python features.py --at 03:00
+
+DB_FILE = ingest.DB_FILE
+FEATURE_VERSION = 1
+WINDOW_DAYS = 30
+CHUNK_METERS = int(os.environ.get('FEATURES_CHUNK_METERS', '500'))
+NIGHT_HOURS = (1, 2, 3, 4)
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+HOUR_FORMAT = '%Y-%m-%d %H'
+DAYS = ['일', '월', '화', '수', '목', '금', '토']
+
+FEATURE_NAMES = (
+    [f'hour_{h:02d}' for h in range(24)]      # 시간대별 평균 사용량 (L/시간)
+    + [f'dow_{w}' for w in range(7)]           # 요일별 평균 일 사용량 (L/일, 0=일요일)
+    + ['weekday_avg', 'weekend_avg',           # 주중/주말 평균 (L/시간)
+       'peak_hour', 'total_30d', 'daily_mean', 'daily_std', 'daily_cv',
+       'trend',                                # 일 사용량 추세 (L/일 변화량)
+       'night_baseline',                       # 새벽(1~4시) 최소 유량의 중앙값 (L/시간), 누수 지표
+       'goal_attainment',                      # 일일 목표 이하로 사용한 날의 비율
+       'days_observed']
+)
+
+
+def ensure_schema(conn):
+    goals.ensure_schema(conn)
+    conn.execute('''CREATE TABLE IF NOT EXISTS household_features
+                    (meter_id TEXT PRIMARY KEY, version INTEGER, window_start TEXT, computed TEXT, vector BLOB)''')
+    conn.commit()
+
+
+def window_start(today=None):
+    return (today or date.today()) - timedelta(days=WINDOW_DAYS)
+
+
+# 계량기 묶음의 시간별 합계 (meter_id, 'YYYY-MM-DD HH', usage) 행으로 (계량기 수 x 특성 수) 배열을 계산
+def compute_features(rows, meters, start, daily_goal):
+    n, days = len(meters), WINDOW_DAYS
+    sums = np.zeros(n * days * 24)
+    counts = np.zeros(n * days * 24)
+    if rows:
+        meter_col, hour_col, usage_col = zip(*rows)
+        m = pd.Index(meters).get_indexer(meter_col)
+        ts = pd.to_datetime(pd.Series(hour_col), format=HOUR_FORMAT, errors='coerce')
+        day = ((ts - pd.Timestamp(start)) // pd.Timedelta(days=1)).to_numpy(dtype=float, na_value=-1)
+        hour = ts.dt.hour.to_numpy(dtype=float, na_value=0)
+        keep = (m >= 0) & (day >= 0) & (day < days)
+        flat = ((m[keep] * days + day[keep].astype(int)) * 24 + hour[keep].astype(int))
+        sums = np.bincount(flat, weights=np.asarray(usage_col, dtype=float)[keep], minlength=n * days * 24)
+        counts = np.bincount(flat, minlength=n * days * 24)
+    sums = sums.reshape(n, days, 24)
+    observed = counts.reshape(n, days, 24) > 0
+    hourly = np.where(observed, sums, np.nan)
+
+    # 관측이 없는 계량기/요일은 NaN으로 남김
+    with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        day_seen = observed.any(axis=2)
+        daily = np.where(day_seen, sums.sum(axis=2), np.nan)
+        days_observed = day_seen.sum(axis=1)
+
+        hour_profile = np.nanmean(hourly, axis=1)
+        weekday = (start.isoweekday() + np.arange(days)) % 7  # %w 규칙 (0=일요일)
+        dow_profile = np.stack([np.nanmean(daily[:, weekday == w], axis=1) for w in range(7)], axis=1)
+        weekend = np.isin(weekday, (0, 6))
+        weekday_avg = np.nanmean(hourly[:, ~weekend].reshape(n, -1), axis=1)
+        weekend_avg = np.nanmean(hourly[:, weekend].reshape(n, -1), axis=1)
+        peak_hour = np.where(np.isnan(hour_profile).all(axis=1), np.nan,
+                             np.nanargmax(np.nan_to_num(hour_profile, nan=-np.inf), axis=1))
+
+        daily_mean = np.nanmean(daily, axis=1)
+        daily_std = np.nanstd(daily, axis=1)
+        daily_cv = daily_std / daily_mean
+
+        # 관측된 날만으로 최소제곱 기울기
+        x = np.where(day_seen, np.arange(days), np.nan)
+        dx = x - np.nanmean(x, axis=1, keepdims=True)
+        dy = daily - daily_mean[:, None]
+        trend = np.nansum(dx * dy, axis=1) / np.nansum(dx * dx, axis=1)
+
+        night_min = np.nanmin(hourly[:, :, NIGHT_HOURS], axis=2)
+        night_baseline = np.nanmedian(night_min, axis=1)
+        goal_attainment = np.nansum(daily <= daily_goal[:, None], axis=1) / days_observed
+
+    return np.column_stack([hour_profile, dow_profile, weekday_avg, weekend_avg, peak_hour,
+                            np.nansum(daily, axis=1), daily_mean, daily_std, daily_cv, trend,
+                            night_baseline, goal_attainment, days_observed]).astype(np.float32)
+
+
+def _compute_chunk(task):
+    db_file, meters, start = task
+    conn = sqlite3.connect(f'file:{db_file}?mode=ro', uri=True, timeout=30)
+    try:
+        # 원시 행 대신 시간별 합계만 파이썬으로 가져옴 (계량기당 최대 WINDOW_DAYS x 24행)
+        rows = conn.execute("""SELECT meter_id, substr(timestamp, 1, 13) AS hour, SUM(usage) FROM water_usage
+                               WHERE meter_id BETWEEN ? AND ? AND timestamp >= ? AND timestamp < ?
+                               GROUP BY meter_id, hour""",
+                            (meters[0], meters[-1], start.strftime(TIME_FORMAT),
+                             (start + timedelta(days=WINDOW_DAYS)).strftime(TIME_FORMAT))).fetchall()
+        daily_goal = goals._goals(conn, meters)[0]
+    finally:
+        conn.close()
+    vectors = compute_features(rows, meters, start, daily_goal)
+    return [(meter_id, vector.tobytes()) for meter_id, vector in zip(meters, vectors)]
+
+
+def _store(conn, results, start):
+    computed = datetime.now().strftime(TIME_FORMAT)
+    with conn:
+        conn.executemany("""INSERT OR REPLACE INTO household_features
+                            (meter_id, version, window_start, computed, vector) VALUES (?, ?, ?, ?, ?)""",
+                         [(meter_id, FEATURE_VERSION, start.isoformat(), computed, blob)
+                          for meter_id, blob in results])
+
+
+# 모든 계량기의 특성을 프로세스 풀에서 계산해 저장하고 계량기 수를 반환
+def build_all(db_file=DB_FILE, processes=None, today=None):
+    db_file = os.path.abspath(db_file)
+    conn = ingest.connect(db_file)
+    try:
+        ensure_schema(conn)
+        start = window_start(today)
+        meters = sorted(ingest.meter_ids(conn))
+        tasks = [(db_file, meters[i:i + CHUNK_METERS], start) for i in range(0, len(meters), CHUNK_METERS)]
+        if not tasks:
+            return 0
+        if processes == 1 or len(tasks) == 1:
+            for task in tasks:
+                _store(conn, _compute_chunk(task), start)
+        else:
+            with mp.get_context('spawn').Pool(processes) as pool:
+                for results in pool.imap_unordered(_compute_chunk, tasks):
+                    _store(conn, results, start)
+        return len(meters)
+    finally:
+        conn.close()
+
+
+# 키 조회 한 번으로 특성 사전을 반환 (없거나 버전/기간이 맞지 않으면 None)
+def load_features(conn, meter_id=ingest.DEFAULT_METER):
+    try:
+        row = conn.execute("SELECT version, window_start, vector FROM household_features WHERE meter_id = ?",
+                           (meter_id,)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    if row is None or row[0] != FEATURE_VERSION or row[1] != window_start().isoformat():
+        return None
+    return dict(zip(FEATURE_NAMES, np.frombuffer(row[2], dtype=np.float32).tolist()))
+
+
+# 페이지용: 저장된 특성을 읽고, 야간 작업이 아직 돌지 않았으면 이 계량기만 즉시 계산해 저장
+def household_features(conn, meter_id=ingest.DEFAULT_METER, db_file=DB_FILE):
+    features = load_features(conn, meter_id)
+    if features is None:
+        db_file = os.path.abspath(db_file)
+        write_conn = ingest.connect(db_file)
+        try:
+            ensure_schema(write_conn)
+            start = window_start()
+            _store(write_conn, _compute_chunk((db_file, [meter_id], start)), start)
+            features = load_features(write_conn, meter_id)
+        finally:
+            write_conn.close()
+    return features
+
+
+# 프롬프트/화면용 요약 문장
+def describe_features(features):
+    if not features or not features['days_observed']:
+        return []
+    lines = [f"최근 {WINDOW_DAYS}일 총 사용량: {features['total_30d']:.0f}L (일평균 {features['daily_mean']:.1f}L, "
+             f"변동계수 {features['daily_cv']:.2f})",
+             f"주중 평균 {features['weekday_avg']:.2f}L/시간, 주말 평균 {features['weekend_avg']:.2f}L/시간",
+             f"가장 많이 쓰는 시간대: {int(features['peak_hour']):02d}시"]
+    dow = [features[f'dow_{w}'] for w in range(7)]
+    if not np.isnan(dow).all():
+        lines.append(f"가장 많이 쓰는 요일: {DAYS[int(np.nanargmax(dow))]}요일")
+    if not np.isnan(features['trend']):
+        lines.append(f"일 사용량 추세: 하루 {features['trend']:+.1f}L")
+    if not np.isnan(features['night_baseline']):
+        lines.append(f"새벽 최소 유량(누수 지표): {features['night_baseline']:.2f}L/시간")
+    lines.append(f"일일 목표 달성률: {features['goal_attainment'] * 100:.0f}%")
+    return lines
+
+
+def run_nightly(db_file=DB_FILE, at='03:00', processes=None):
+    hour, minute = map(int, at.split(':'))
+    while True:
+        now = datetime.now()
+        next_run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        time.sleep((next_run - now).total_seconds())
+        started = time.monotonic()
+        count = build_all(db_file, processes)
+        print(f"Features built: {count} households in {time.monotonic() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='가구별 사용 패턴 특성 야간 배치')
+    parser.add_argument('--db', default=DB_FILE)
+    parser.add_argument('--once', action='store_true')
+    parser.add_argument('--at', default='03:00', help='매일 실행할 시각 (HH:MM)')
+    parser.add_argument('--processes', type=int, default=None, help='기본값은 CPU 수')
+    args = parser.parse_args()
+
+    if args.once:
+        started = time.monotonic()
+        count = build_all(args.db, args.processes)
+        print(f"Features built: {count} households in {time.monotonic() - started:.1f}s")
+    else:
+        run_nightly(args.db, args.at, args.processes)
+
+
+if __name__ == '__main__':
+    main()
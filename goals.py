@@ -0,0 +1,269 @@
+import argparse
+import os
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import ingest
+
+# 목표/챌린지/알림 스케줄러
+# 앱을 열지 않아도 모든 가구의 일일 목표, 주간 챌린지, 사용량 경고를 주기적으로 평가한다.
+# - water_usage의 새 행만(rowid 워터마크) 일별 집계 테이블 usage_daily에 더한다.
+# - 최근 WINDOW_DAYS일의 일별 집계를 계량기 BATCH_METERS개씩 읽어 (계량기 x 날짜) 배열로 만들고
+#   목표 대비 사용률, 주간 절감률, 급증 여부를 한 번에 계산한다.
+# - 결과는 goal_status(페이지가 읽는 현재 상태)와 notifications(알림, 기간별 1회)에 기록한다.
+# - 배치마다 걸린 시간에 비례해 쉬어 CPU 사용률을 GOALS_CPU_SHARE 이하로 유지한다.
+#
+#   python goals.py --once
+#   python goals.py --interval 300
+
+DB_FILE = ingest.DB_FILE
+DEFAULT_DAILY_GOAL = float(os.environ.get('DEFAULT_DAILY_GOAL', '200'))
+DEFAULT_CHALLENGE = '설거지 물 사용량 20% 줄이기'
+DEFAULT_TARGET_PCT = float(os.environ.get('DEFAULT_CHALLENGE_PCT', '20'))
+WARN_RATIO = float(os.environ.get('GOAL_WARN_RATIO', '0.8'))
+SPIKE_RATIO = float(os.environ.get('USAGE_SPIKE_RATIO', '2.0'))
+WINDOW_DAYS = 21
+BATCH_METERS = int(os.environ.get('GOALS_BATCH_METERS', '5000'))
+ROLLUP_CHUNK_ROWS = int(os.environ.get('GOALS_ROLLUP_CHUNK_ROWS', '200000'))
+CPU_SHARE = float(os.environ.get('GOALS_CPU_SHARE', '0.25'))
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def ensure_schema(conn):
+    ingest.ensure_schema(conn)
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS usage_daily
+            (meter_id TEXT, day TEXT, usage REAL, samples INTEGER, PRIMARY KEY (meter_id, day));
+        CREATE TABLE IF NOT EXISTS household_goals
+            (meter_id TEXT PRIMARY KEY, daily_goal REAL, weekly_challenge TEXT, challenge_pct REAL,
+             alert_threshold REAL);
+        CREATE TABLE IF NOT EXISTS goal_status
+            (meter_id TEXT PRIMARY KEY, day TEXT, today_usage REAL, daily_goal REAL, progress REAL,
+             week_usage REAL, last_week_usage REAL, reduction_pct REAL, challenge TEXT,
+             challenge_pct REAL, updated TEXT);
+        CREATE TABLE IF NOT EXISTS notifications
+            (id INTEGER PRIMARY KEY, meter_id TEXT, kind TEXT, period TEXT, message TEXT, created TEXT,
+             is_read INTEGER NOT NULL DEFAULT 0, UNIQUE (meter_id, kind, period));
+        CREATE INDEX IF NOT EXISTS idx_notifications_meter ON notifications (meter_id, is_read, id);
+        CREATE TABLE IF NOT EXISTS scheduler_watermarks (name TEXT PRIMARY KEY, value INTEGER);
+        CREATE TABLE IF NOT EXISTS user_info (key TEXT PRIMARY KEY, value TEXT);
+    ''')
+    # 기존 user_info의 단일 사용자 목표를 기본 계량기의 목표로 옮김
+    legacy = dict(conn.execute("SELECT key, value FROM user_info WHERE key IN ('daily_goal', 'weekly_challenge')"))
+    conn.execute("""INSERT OR IGNORE INTO household_goals (meter_id, daily_goal, weekly_challenge, challenge_pct)
+                    VALUES (?, ?, ?, ?)""",
+                 (ingest.DEFAULT_METER, float(legacy.get('daily_goal', DEFAULT_DAILY_GOAL)),
+                  legacy.get('weekly_challenge', DEFAULT_CHALLENGE), DEFAULT_TARGET_PCT))
+    conn.commit()
+
+
+# 새로 들어온 행을 일별 집계에 더하고 처리한 행 수를 반환
+def rollup_daily(conn):
+    row = conn.execute("SELECT value FROM scheduler_watermarks WHERE name = 'usage_daily'").fetchone()
+    watermark = row[0] if row else 0
+    end = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM water_usage").fetchone()[0]
+    processed = 0
+    while watermark < end:
+        upper = min(watermark + ROLLUP_CHUNK_ROWS, end)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("""INSERT INTO usage_daily (meter_id, day, usage, samples)
+                            SELECT meter_id, substr(timestamp, 1, 10), SUM(usage), COUNT(*)
+                            FROM water_usage WHERE rowid > ? AND rowid <= ?
+                            GROUP BY meter_id, substr(timestamp, 1, 10)
+                            ON CONFLICT (meter_id, day) DO UPDATE
+                            SET usage = usage + excluded.usage, samples = samples + excluded.samples""",
+                         (watermark, upper))
+            conn.execute("INSERT OR REPLACE INTO scheduler_watermarks (name, value) VALUES ('usage_daily', ?)",
+                         (upper,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        processed += upper - watermark
+        watermark = upper
+    return processed
+
+
+def _goals(conn, meters):
+    placeholders = ','.join('?' * len(meters))
+    goals = pd.read_sql_query(f"""SELECT meter_id, daily_goal, weekly_challenge, challenge_pct, alert_threshold
+                                  FROM household_goals WHERE meter_id IN ({placeholders})""",
+                              conn, params=meters, index_col='meter_id').reindex(meters)
+    return (goals['daily_goal'].fillna(DEFAULT_DAILY_GOAL).to_numpy(dtype=float),
+            goals['weekly_challenge'].fillna(DEFAULT_CHALLENGE).to_numpy(dtype=object),
+            goals['challenge_pct'].fillna(DEFAULT_TARGET_PCT).to_numpy(dtype=float),
+            goals['alert_threshold'].to_numpy(dtype=float))
+
+
+# 계량기 묶음 하나를 평가해 (상태 행, 알림 행)을 반환
+def evaluate_batch(conn, meters, today):
+    days = [(today - timedelta(days=WINDOW_DAYS - 1 - i)).isoformat() for i in range(WINDOW_DAYS)]
+    rows = conn.execute("""SELECT meter_id, day, usage FROM usage_daily
+                           WHERE meter_id BETWEEN ? AND ? AND day >= ? AND day <= ?""",
+                        (meters[0], meters[-1], days[0], days[-1])).fetchall()
+    usage = np.zeros((len(meters), WINDOW_DAYS))
+    if rows:
+        meter_col, day_col, value_col = zip(*rows)
+        # 평가 도중 새로 생긴 계량기(목록에 없음, -1)는 다음 주기에 평가
+        m = pd.Index(meters).get_indexer(meter_col)
+        d = pd.Index(days).get_indexer(day_col)
+        keep = m >= 0
+        usage[m[keep], d[keep]] = np.asarray(value_col, dtype=float)[keep]
+
+    daily_goal, challenge, challenge_pct, threshold = _goals(conn, meters)
+    today_usage = usage[:, -1]
+    progress = today_usage / daily_goal
+
+    # 이번 주(월요일부터 오늘까지)와 지난주 같은 요일 구간 비교
+    elapsed = today.weekday() + 1
+    week_usage = usage[:, -elapsed:].sum(axis=1)
+    last_week_usage = usage[:, -elapsed - 7:-7].sum(axis=1)
+    reduction = np.divide(last_week_usage - week_usage, last_week_usage,
+                          out=np.full(len(meters), np.nan), where=last_week_usage > 0) * 100
+
+    # 지난주 전체(월~일)와 그 전 주 비교: 주가 끝난 뒤 첫 평가에서 결과 알림
+    prev_week = usage[:, -elapsed - 7:-elapsed].sum(axis=1)
+    prev_prev_week = usage[:, -elapsed - 14:-elapsed - 7].sum(axis=1)
+    prev_reduction = np.divide(prev_prev_week - prev_week, prev_prev_week,
+                               out=np.full(len(meters), np.nan), where=prev_prev_week > 0) * 100
+
+    # 급증: 오늘 사용량이 직전 7일 중앙값의 SPIKE_RATIO배 이상 (또는 가구별 절대 기준 초과)
+    baseline = np.median(usage[:, -8:-1], axis=1)
+    spike = ((baseline > 0) & (today_usage >= SPIKE_RATIO * baseline)) | (today_usage >= threshold)
+
+    now = datetime.now().strftime(TIME_FORMAT)
+    day = today.isoformat()
+    prev_week_start = (today - timedelta(days=today.weekday() + 7)).isoformat()
+    statuses = list(zip(meters, [day] * len(meters), today_usage.tolist(), daily_goal.tolist(),
+                        progress.tolist(), week_usage.tolist(), last_week_usage.tolist(),
+                        np.where(np.isnan(reduction), None, reduction).tolist(), challenge.tolist(),
+                        challenge_pct.tolist(), [now] * len(meters)))
+
+    notifications = []
+    for i in np.flatnonzero(progress >= 1):
+        notifications.append((meters[i], 'goal_exceeded', day,
+                              f'오늘 사용량 {today_usage[i]:.0f}L로 일일 목표 {daily_goal[i]:.0f}L를 넘었습니다.', now))
+    for i in np.flatnonzero((progress >= WARN_RATIO) & (progress < 1)):
+        notifications.append((meters[i], 'goal_warning', day,
+                              f'일일 목표의 {progress[i] * 100:.0f}%를 사용했습니다.', now))
+    for i in np.flatnonzero(spike):
+        notifications.append((meters[i], 'usage_spike', day,
+                              f'오늘 사용량 {today_usage[i]:.0f}L가 평소({baseline[i]:.0f}L)보다 크게 많습니다. '
+                              '누수나 수도꼭지 잠금을 확인해 보세요.', now))
+    for i in np.flatnonzero(~np.isnan(prev_reduction)):
+        achieved = prev_reduction[i] >= challenge_pct[i]
+        message = (f"지난주 챌린지 '{challenge[i]}' 달성! 전주 대비 {prev_reduction[i]:.0f}% 절감했습니다."
+                   if achieved else
+                   f"지난주 전주 대비 절감률은 {prev_reduction[i]:.0f}%였습니다 (챌린지 목표 {challenge_pct[i]:.0f}%).")
+        # 같은 주의 결과 알림은 UNIQUE (meter_id, kind, period) 제약으로 한 번만 저장됨
+        notifications.append((meters[i], 'challenge_result', prev_week_start, message, now))
+    return statuses, notifications
+
+
+# 모든 계량기를 평가하고 (평가한 계량기 수, 새 알림 수)를 반환
+def evaluate_all(conn, today=None, cpu_share=CPU_SHARE):
+    today = today or date.today()
+    since = (today - timedelta(days=WINDOW_DAYS - 1)).isoformat()
+    meters = [row[0] for row in conn.execute("""SELECT meter_id FROM household_goals
+                                                UNION SELECT DISTINCT meter_id FROM usage_daily WHERE day >= ?
+                                                ORDER BY 1""", (since,))]
+    evaluated = created = 0
+    for start in range(0, len(meters), BATCH_METERS):
+        started = time.monotonic()
+        batch = meters[start:start + BATCH_METERS]
+        statuses, notifications = evaluate_batch(conn, batch, today)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("""INSERT OR REPLACE INTO goal_status
+                                (meter_id, day, today_usage, daily_goal, progress, week_usage, last_week_usage,
+                                 reduction_pct, challenge, challenge_pct, updated)
+                                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", statuses)
+            before = conn.total_changes
+            conn.executemany("""INSERT OR IGNORE INTO notifications (meter_id, kind, period, message, created)
+                                VALUES (?, ?, ?, ?, ?)""", notifications)
+            created += conn.total_changes - before
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        evaluated += len(batch)
+        # CPU 사용률 제한: 일한 시간만큼 비례해 쉼
+        if cpu_share < 1:
+            time.sleep((time.monotonic() - started) * (1 - cpu_share) / cpu_share)
+    return evaluated, created
+
+
+def run_once(conn):
+    rolled = rollup_daily(conn)
+    evaluated, created = evaluate_all(conn)
+    return {'rolled_up_rows': rolled, 'households': evaluated, 'notifications': created}
+
+
+# 페이지용: 계량기의 최근 평가 상태 (없으면 None)
+def goal_status(conn, meter_id=ingest.DEFAULT_METER):
+    try:
+        cursor = conn.execute("SELECT * FROM goal_status WHERE meter_id = ?", (meter_id,))
+    except sqlite3.OperationalError:
+        return None
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    status = dict(zip([c[0] for c in cursor.description], row))
+    # 자정 이후 또는 스케줄러가 돌지 않을 때 남아 있는 지난 날짜의 상태는 없는 것으로 봄
+    if status['day'] != date.today().isoformat():
+        return None
+    return status
+
+
+def recent_notifications(conn, meter_id=ingest.DEFAULT_METER, limit=5):
+    try:
+        return conn.execute("""SELECT id, kind, message, created FROM notifications
+                               WHERE meter_id = ? AND is_read = 0 ORDER BY id DESC LIMIT ?""",
+                            (meter_id, limit)).fetchall()
+    except sqlite3.OperationalError:
+        return []
+
+
+def mark_read(conn, meter_id=ingest.DEFAULT_METER):
+    with conn:
+        conn.execute("UPDATE notifications SET is_read = 1 WHERE meter_id = ? AND is_read = 0", (meter_id,))
+
+
+def _tick(conn):
+    ensure_schema(conn)
+    print(f"Goals evaluated: {run_once(conn)}")
+
+
+def run_forever(db_file=DB_FILE, interval=300, stop_event=None):
+    ingest.run_periodically(_tick, db_file, interval, stop_event, autocommit=True, label='목표 평가')
+
+
+# 다른 프로그램(데이터 생성기 등) 안에서 주기적으로 평가
+def start_background_scheduler(db_file=DB_FILE, interval=300):
+    return ingest.start_periodic_thread(_tick, db_file, interval, autocommit=True, label='목표 평가')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='가구별 목표/챌린지/알림 평가 스케줄러')
+    parser.add_argument('--db', default=DB_FILE)
+    parser.add_argument('--once', action='store_true')
+    parser.add_argument('--interval', type=int, default=300)
+    args = parser.parse_args()
+
+    if args.once:
+        conn = ingest.connect(args.db, autocommit=True)
+        ensure_schema(conn)
+        print(run_once(conn))
+        conn.close()
+    else:
+        run_forever(args.db, args.interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+from datetime import date, timedelta
+from functools import lru_cache
+
+import numpy as np
+
+import ingest
+import retention
+
+# 환경 영향 몬테카를로 시뮬레이터
+# 가구의 실제 일일 사용량 분포(평균/표준편차)를 바탕으로 절약률 시나리오 수천 개를
+# NumPy 벡터 연산으로 한 번에 계산한다. 네트워크 호출 없이 1초 이내에 끝나며,
+# 같은 입력에 대해서는 결과를 캐시한다.
+#
+# 가정 (시나리오마다 범위 안에서 무작위로 뽑음)
+# - 상수도 생산/정수/하수 처리 에너지: 0.4~0.8 kWh/m³
+# - 절약한 물 중 온수 비율: 20~40%, 온수 가열 에너지 약 29.1 kWh/m³ (25℃ 상승), 효율 85%
+# - 전력 배출계수: 0.42~0.50 kgCO2/kWh
+# - 소나무 한 그루 연간 CO2 흡수량: 6.6 kg
+
+DEFAULT_DAILY_MEAN = 200.0
+DEFAULT_DAILY_STD = 40.0
+DAYS_PER_MONTH = 30.4
+HOT_WATER_KWH_PER_M3 = 29.1
+HEATER_EFFICIENCY = 0.85
+TREE_CO2_KG_PER_YEAR = 6.6
+PERCENTILES = (5, 50, 95)
+# 원시 데이터 보존 기간 안에서 온전히 남아 있는 날 수 (보존 경계의 날은 일부가 집계로 옮겨짐)
+PROFILE_DAYS = retention.RAW_DAYS - 1
+
+
+# 어제까지 최근 days일(로컬 날짜, 오늘 제외)의 일일 총 사용량 평균/표준편차 (데이터가 없으면 기본값)
+def usage_profile(conn, meter_id=ingest.DEFAULT_METER, days=PROFILE_DAYS):
+    today = date.today()
+    rows = conn.execute("""SELECT SUM(usage) FROM water_usage
+                           WHERE meter_id = ? AND timestamp >= ? AND timestamp < ?
+                           GROUP BY substr(timestamp, 1, 10)""",
+                        (meter_id, (today - timedelta(days=min(days, PROFILE_DAYS))).isoformat(),
+                         today.isoformat())).fetchall()
+    daily = np.array([r[0] for r in rows if r[0] is not None], dtype=float)
+    if len(daily) < 2:
+        return DEFAULT_DAILY_MEAN, DEFAULT_DAILY_STD
+    # 캐시 적중률을 높이기 위해 0.1L 단위로 반올림
+    return round(float(daily.mean()), 1), round(float(daily.std(ddof=1)), 1)
+
+
+@lru_cache(maxsize=256)
+def simulate(daily_mean, daily_std, rate_low=0.05, rate_high=0.15, years=10, scenarios=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    months = 12 * years
+
+    # 월간 기본 사용량: 일일 사용량의 합(중심극한정리 근사) + 시나리오별 연간 추세
+    monthly_mean = daily_mean * DAYS_PER_MONTH
+    monthly_std = daily_std * np.sqrt(DAYS_PER_MONTH)
+    base = rng.normal(monthly_mean, monthly_std, size=(scenarios, months))
+    drift = rng.normal(0.0, 0.02, size=(scenarios, 1))
+    base *= (1 + drift) ** (np.arange(months) / 12)
+    np.clip(base, 0, None, out=base)
+
+    # 절약률: 시나리오별 목표 절약률 x 첫 6개월 적응 기간 x 월별 실천도(Beta)
+    target = rng.uniform(rate_low, rate_high, size=(scenarios, 1))
+    ramp = np.minimum(1.0, (np.arange(months) + 1) / 6)
+    adherence = rng.beta(8, 2, size=(scenarios, months))
+    saved_l = base * target * ramp * adherence
+
+    # 에너지/CO2 환산 계수 (시나리오별)
+    supply_kwh = rng.uniform(0.4, 0.8, size=(scenarios, 1))
+    hot_share = rng.uniform(0.2, 0.4, size=(scenarios, 1))
+    co2_factor = rng.uniform(0.42, 0.50, size=(scenarios, 1))
+    kwh_per_l = (supply_kwh + hot_share * HOT_WATER_KWH_PER_M3 / HEATER_EFFICIENCY) / 1000
+
+    # 연도별 누적값 (scenarios x years)
+    yearly_water = saved_l.reshape(scenarios, years, 12).sum(axis=2).cumsum(axis=1)
+    yearly_energy = yearly_water * kwh_per_l
+    yearly_co2 = yearly_energy * co2_factor
+
+    def summarize(values):
+        return {
+            'mean': values.mean(axis=0),
+            'percentiles': dict(zip(PERCENTILES, np.percentile(values, PERCENTILES, axis=0))),
+        }
+
+    return {
+        'years': np.arange(1, years + 1),
+        'water_l': summarize(yearly_water),
+        'energy_kwh': summarize(yearly_energy),
+        'co2_kg': summarize(yearly_co2),
+        'final_co2_samples': yearly_co2[:, -1],
+        'trees': summarize(yearly_co2 / (TREE_CO2_KG_PER_YEAR * np.arange(1, years + 1))),
+    }
@@ -0,0 +1,117 @@
+import os
+import sqlite3
+import threading
+
+# 측정값 적재 경로
+# 데이터 생성기/부하 시뮬레이터 등 water_usage에 쓰는 모든 코드는 이 모듈을 거친다.
+# 가구(계량기)별 데이터를 구분하기 위해 water_usage에 meter_id 열을 두며,
+# 기존 단일 계량기 데이터는 기본 계량기(METER_ID, 기본값 'home')로 취급한다.
+
+DB_FILE = os.environ.get('DB_FILE', 'water_usage.db')
+DEFAULT_METER = os.environ.get('METER_ID', 'home')
+
+# 적재 직후 (db_file, rows)로 호출할 함수들 (같은 프로세스의 ring_buffer 등)
+_subscribers = []
+
+
+# autocommit=True이면 트랜잭션을 직접(BEGIN IMMEDIATE 등) 여닫는 배치 작업용 연결
+def connect(db_file=DB_FILE, autocommit=False):
+    conn = sqlite3.connect(db_file, timeout=30, isolation_level=None if autocommit else '')
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+# fn(conn)을 interval초마다 실행 (잠금 등 OperationalError는 출력하고 다음 주기에 다시 시도)
+def run_periodically(fn, db_file=DB_FILE, interval=300, stop_event=None, autocommit=False, label='작업'):
+    stop_event = stop_event or threading.Event()
+    conn = connect(db_file, autocommit)
+    try:
+        while not stop_event.is_set():
+            try:
+                fn(conn)
+            except sqlite3.OperationalError as e:
+                print(f"{label} 중 오류 발생: {e}")
+            stop_event.wait(interval)
+    finally:
+        conn.close()
+
+
+# 데이터 생성기 등 장시간 실행되는 프로세스 안에서 run_periodically를 데몬 스레드로 실행
+# 반환한 이벤트를 set()하면 멈춤
+def start_periodic_thread(fn, db_file=DB_FILE, interval=300, autocommit=False, label='작업'):
+    stop_event = threading.Event()
+    thread = threading.Thread(target=run_periodically, args=(fn, db_file, interval, stop_event, autocommit, label),
+                              daemon=True)
+    thread.start()
+    return stop_event
+
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def ensure_schema(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS water_usage
+                    (timestamp TEXT, usage REAL)''')
+    if 'meter_id' not in _columns(conn, 'water_usage'):
+        # 기본값이 있는 열 추가는 테이블을 다시 쓰지 않으므로 큰 테이블에서도 즉시 끝남
+        conn.execute(f"ALTER TABLE water_usage ADD COLUMN meter_id TEXT NOT NULL DEFAULT '{DEFAULT_METER}'")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_water_usage_meter_ts ON water_usage (meter_id, timestamp)")
+    conn.commit()
+
+
+# meter_id가 키에 포함되도록 파생 테이블을 다시 만든다 (이전 버전에서 만든 테이블 이전용)
+# create_sql은 {table} 자리표시자를 가진 새 스키마
+def ensure_meter_keyed(conn, table, create_sql):
+    columns = _columns(conn, table)
+    if not columns:
+        conn.execute(create_sql.format(table=table))
+        return
+    if 'meter_id' in columns:
+        return
+    names = ', '.join(columns)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+        conn.execute(create_sql.format(table=table))
+        conn.execute(f"INSERT INTO {table} (meter_id, {names}) SELECT ?, {names} FROM {table}_old", (DEFAULT_METER,))
+        conn.execute(f"DROP TABLE {table}_old")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def subscribe(callback):
+    _subscribers.append(callback)
+
+
+# (meter_id, timestamp, usage) 행들을 한 트랜잭션으로 적재하고 적재한 행 수를 반환
+def insert_readings(conn, rows):
+    rows = list(rows)
+    with conn:
+        conn.executemany("INSERT INTO water_usage (meter_id, timestamp, usage) VALUES (?, ?, ?)", rows)
+    if _subscribers:
+        db_file = conn.execute("PRAGMA database_list").fetchone()[2]
+        for callback in _subscribers:
+            callback(db_file, rows)
+    return len(rows)
+
+
+# 이미 있는 (meter_id, timestamp)는 건너뛰고 적재한 행 수를 반환 (일괄 가져오기용)
+# 커밋하지 않으므로 호출하는 쪽에서 여러 번 호출한 뒤 큰 트랜잭션 단위로 커밋한다
+def insert_new_readings(conn, rows):
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS import_staging (meter_id TEXT, timestamp TEXT, usage REAL)")
+    conn.executemany("INSERT INTO import_staging (meter_id, timestamp, usage) VALUES (?, ?, ?)", rows)
+    # (meter_id, timestamp) 인덱스로 기존 행 존재 여부만 확인
+    cursor = conn.execute("""INSERT INTO water_usage (meter_id, timestamp, usage)
+                             SELECT meter_id, timestamp, usage FROM import_staging s
+                             WHERE NOT EXISTS (SELECT 1 FROM water_usage w
+                                               WHERE w.meter_id = s.meter_id AND w.timestamp = s.timestamp)""")
+    conn.execute("DELETE FROM import_staging")
+    return cursor.rowcount
+
+
+def meter_ids(conn):
+    return [row[0] for row in conn.execute("SELECT DISTINCT meter_id FROM water_usage")]
@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+import plotly.graph_objects as go
+import streamlit as st
+
+import ingest
+import ring_buffer
+
+# 실시간 모니터링 차트
+# 프로세스 공유 링 버퍼(ring_buffer)에서 바로 집계하므로 세션별 SQL 조회나 DataFrame 생성이 없다.
+# 라이브 모드에서는 차트 fragment만 주기적으로 다시 실행한다.
+
+REFRESH_SECONDS = float(os.environ.get('LIVE_REFRESH_SECONDS', '5'))
+WINDOW_HOURS = 24
+DAYS = ['일', '월', '화', '수', '목', '금', '토']
+
+# st.fragment는 streamlit 1.37부터, 그 이전에는 experimental_fragment
+_fragment = getattr(st, 'fragment', None) or st.experimental_fragment
+
+
+# 데이터가 있는 칸만 (라벨, 값)으로 반환
+def _bars(averages, labels):
+    present = np.flatnonzero(~np.isnan(averages))
+    return [labels[i] for i in present], averages[present]
+
+
+def hourly_figure(db_file, meter_id=ingest.DEFAULT_METER, title='시간대별 평균 물 사용량 (최근 24시간)'):
+    averages = ring_buffer.get_buffer(db_file).hourly_average(meter_id, WINDOW_HOURS)
+    x, y = _bars(averages, [f'{h:02d}' for h in range(24)])
+    fig = go.Figure(data=go.Bar(x=x, y=y))
+    fig.update_layout(title=title, xaxis_title='시간', yaxis_title='사용량 (L)')
+    return fig
+
+
+def weekday_figure(db_file, meter_id=ingest.DEFAULT_METER):
+    averages = ring_buffer.get_buffer(db_file).weekday_average(meter_id, 7)
+    x, y = _bars(averages, DAYS)
+    fig = go.Figure(data=go.Bar(x=x, y=y))
+    fig.update_layout(title='요일별 평균 물 사용량 (최근 7일)', xaxis_title='요일', yaxis_title='사용량 (L)')
+    return fig
+
+
+# 오늘 0시 이후 사용량
+def today_usage(db_file, meter_id=ingest.DEFAULT_METER):
+    return ring_buffer.get_buffer(db_file).today_total(meter_id)
+
+
+@_fragment(run_every=REFRESH_SECONDS)
+def live_hourly_chart(db_file, meter_id=ingest.DEFAULT_METER):
+    st.plotly_chart(hourly_figure(db_file, meter_id, '시간대별 평균 물 사용량 (최근 24시간, 실시간)'),
+                    key='live_hourly_chart')
+    latest = ring_buffer.get_buffer(db_file).latest(meter_id)
+    if latest:
+        timestamp, usage = latest
+        st.caption(f"최근 측정: {timestamp} · {usage:.2f}L · {REFRESH_SECONDS:g}초마다 갱신")
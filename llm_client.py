@@ -0,0 +1,234 @@
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# LLM 호출 공용 전송 계층
+# - 커넥션 풀/keep-alive 세션 재사용 (매 호출마다 TCP+TLS 핸드셰이크 방지)
+# - 연결/응답 타임아웃
+# - 429/5xx 및 네트워크 오류에 대한 지터 포함 지수 백오프 재시도
+# - 클라이언트 측 토큰 버킷 속도 제한
+# - 서킷 브레이커: 열려 있으면 즉시 LLMUnavailable을 발생시켜 페이지가 대체 문구로 넘어가게 함
+
+# 오프라인 테스트 시 llm_stub.py 서버를 가리키도록 LLM_BASE_URL로 변경 가능
+API_BASE_URL = os.environ.get('LLM_BASE_URL', 'https://api.anthropic.com')
+
+CONNECT_TIMEOUT = float(os.environ.get('LLM_CONNECT_TIMEOUT', '3.05'))
+READ_TIMEOUT = float(os.environ.get('LLM_READ_TIMEOUT', '30'))
+MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', '3'))
+BACKOFF_BASE = float(os.environ.get('LLM_BACKOFF_BASE', '0.5'))
+BACKOFF_MAX = float(os.environ.get('LLM_BACKOFF_MAX', '8'))
+RATE_PER_SEC = float(os.environ.get('LLM_RATE_PER_SEC', '2'))
+RATE_BURST = int(os.environ.get('LLM_RATE_BURST', '5'))
+RATE_MAX_WAIT = float(os.environ.get('LLM_RATE_MAX_WAIT', '2'))
+BREAKER_THRESHOLD = int(os.environ.get('LLM_BREAKER_THRESHOLD', '5'))
+BREAKER_COOLDOWN = float(os.environ.get('LLM_BREAKER_COOLDOWN', '30'))
+POOL_SIZE = int(os.environ.get('LLM_POOL_SIZE', '10'))
+
+RETRY_STATUS = {429, 500, 502, 503, 504, 529}
+
+FALLBACK_TEXT = "AI 서비스가 일시적으로 응답하지 않습니다. 잠시 후 다시 시도해주세요."
+
+
+class LLMUnavailable(Exception):
+    pass
+
+
+class RetryableStatus(Exception):
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+# 토큰 버킷 속도 제한기
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    # 사용하지 못한 토큰을 돌려줌
+    def refund(self):
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + 1)
+
+    def acquire(self, max_wait):
+        deadline = time.monotonic() + max_wait
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+# 서킷 브레이커 (closed -> open -> half_open -> closed)
+class CircuitBreaker:
+    def __init__(self, failure_threshold, cooldown):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self.lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        with self.lock:
+            state = self._state()
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self.probing:
+                # 쿨다운 이후 한 번의 시험 호출만 허용
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+    # 결과와 무관하게 시험 호출을 끝냄 (상태는 그대로 두고 다음 호출이 다시 시험할 수 있게 함)
+    def release(self):
+        with self.lock:
+            self.probing = False
+
+
+def _is_retryable(exc):
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+        return True
+    # anthropic SDK 예외는 status_code 속성 또는 클래스 이름으로 구분
+    if getattr(exc, 'status_code', None) in RETRY_STATUS:
+        return True
+    return type(exc).__name__ in ('APIConnectionError', 'APITimeoutError')
+
+
+def _retry_after(exc):
+    value = getattr(exc, 'retry_after', None)
+    response = getattr(exc, 'response', None)
+    if value is None and response is not None:
+        value = response.headers.get('retry-after')
+    try:
+        return min(BACKOFF_MAX, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+class LLMTransport:
+    def __init__(self, base_url=API_BASE_URL):
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.bucket = TokenBucket(RATE_PER_SEC, RATE_BURST)
+        self.breaker = CircuitBreaker(BREAKER_THRESHOLD, BREAKER_COOLDOWN)
+
+    # 재시도/속도 제한/서킷 브레이커를 적용해 fn()을 실행
+    def call(self, fn):
+        last_exc = None
+        for attempt in range(MAX_RETRIES + 1):
+            # 열린 상태에서는 토큰을 쓰거나 기다리지 않고 바로 대체 응답으로 넘어감
+            if self.breaker.state == 'open':
+                raise LLMUnavailable("서킷 브레이커가 열려 있습니다.") from last_exc
+            # 토큰을 먼저 받아야 half_open 시험 호출 권한을 쥔 채로 대기/거절되지 않음
+            if not self.bucket.acquire(RATE_MAX_WAIT):
+                raise LLMUnavailable("요청 한도를 초과했습니다.") from last_exc
+            if not self.breaker.allow():
+                self.bucket.refund()
+                raise LLMUnavailable("서킷 브레이커가 열려 있습니다.") from last_exc
+            try:
+                result = fn()
+            except BaseException as e:
+                if not isinstance(e, Exception) or not _is_retryable(e):
+                    # 401/400 같은 재시도 대상이 아닌 오류는 가용성 판단에 쓰지 않음
+                    self.breaker.release()
+                    raise
+                self.breaker.record_failure()
+                last_exc = e
+                if attempt == MAX_RETRIES:
+                    break
+                delay = _retry_after(e)
+                if delay is None:
+                    # full jitter 지수 백오프
+                    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+        raise LLMUnavailable(f"재시도 횟수를 초과했습니다: {last_exc}") from last_exc
+
+    # JSON POST 요청. 재시도 대상이 아닌 응답(200, 4xx 등)은 그대로 반환
+    def post_json(self, path, headers, payload):
+        def send():
+            response = self.session.post(self.base_url + path, headers=headers, json=payload,
+                                         timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+            if response.status_code in RETRY_STATUS:
+                raise RetryableStatus(response.status_code, response.headers.get('retry-after'))
+            return response
+        return self.call(send)
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+# 프로세스 전체에서 공유하는 전송 계층 (Streamlit 재실행 간에도 유지됨)
+def get_transport():
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = LLMTransport()
+        return _transport
+
+
+# 최근 성공 응답 캐시 (서킷이 열렸을 때 대체 문구로 사용)
+_last_good = OrderedDict()
+_last_good_lock = threading.Lock()
+LAST_GOOD_MAX = 256
+
+
+def remember_completion(prompt, completion):
+    with _last_good_lock:
+        _last_good[prompt] = completion
+        _last_good.move_to_end(prompt)
+        while len(_last_good) > LAST_GOOD_MAX:
+            _last_good.popitem(last=False)
+
+
+def cached_completion(prompt, fallback=FALLBACK_TEXT):
+    with _last_good_lock:
+        return _last_good.get(prompt, fallback)
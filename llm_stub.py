@@ -0,0 +1,240 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+# 오프라인 부하 테스트용 로컬 LLM 대역 서버
+# /v1/complete (legacy completions API)를 흉내 내므로 call_claude_api()와
+# app_api.py의 Anthropic 클라이언트 모두 LLM_BASE_URL 환경 변수로 이 서버를 가리킬 수 있다.
+#
+#   python llm_stub.py --mode replay --fixtures llm_fixtures.jsonl --latency lognormal:-0.5:0.6 --error-rate 0.05
+#   LLM_BASE_URL=http://127.0.0.1:8765 streamlit run watersave-app.py
+#
+# 모드
+# - synthetic: 프롬프트 해시로 결정되는 합성 응답
+# - replay:    기록된 픽스처 응답, 없으면 합성 응답 (--strict면 404)
+# - record:    실제 API로 전달하고 응답을 픽스처 파일에 추가
+
+UPSTREAM_URL = 'https://api.anthropic.com'
+
+SYNTHETIC_SENTENCES = [
+    "샤워 시간을 1분 줄이면 하루 약 10L를 절약할 수 있습니다.",
+    "세탁기는 빨래를 모아서 한 번에 돌리는 것이 좋습니다.",
+    "양치할 때 컵을 사용하면 물 낭비를 줄일 수 있습니다.",
+    "설거지는 물을 받아서 하면 사용량이 크게 줄어듭니다.",
+    "변기 수조에 물병을 넣으면 한 번에 1L 이상 절약됩니다.",
+    "야간 사용량이 계속 높다면 누수를 점검해보세요.",
+    "절수형 샤워기 헤드로 교체하면 사용량을 30%까지 줄일 수 있습니다.",
+    "빗물을 모아 화분에 주면 수돗물 사용을 줄일 수 있습니다.",
+]
+
+
+# 지연 분포 파서: fixed:s | uniform:a:b | normal:mu:sigma | lognormal:mu:sigma | exponential:mean
+def parse_latency(spec):
+    name, *params = spec.split(':')
+    params = [float(p) for p in params]
+    samplers = {
+        'fixed': lambda: params[0],
+        'uniform': lambda: random.uniform(params[0], params[1]),
+        'normal': lambda: random.gauss(params[0], params[1]),
+        'lognormal': lambda: random.lognormvariate(params[0], params[1]),
+        'exponential': lambda: random.expovariate(1 / params[0]),
+    }
+    if name not in samplers:
+        raise ValueError(f"알 수 없는 지연 분포입니다: {spec}")
+    sampler = samplers[name]
+    return lambda: max(0.0, sampler())
+
+
+def fixture_key(model, prompt):
+    return hashlib.sha256(f"{model}\0{prompt.strip()}".encode('utf-8')).hexdigest()
+
+
+def synthetic_completion(prompt, max_tokens):
+    rng = random.Random(fixture_key('synthetic', prompt))
+    count = max(1, min(len(SYNTHETIC_SENTENCES), max_tokens // 60))
+    return ' ' + ' '.join(rng.sample(SYNTHETIC_SENTENCES, count))
+
+
+class FixtureStore:
+    def __init__(self, path):
+        self.path = path
+        self.responses = {}
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.responses[record['key']] = record['completion']
+
+    def get(self, key):
+        return self.responses.get(key)
+
+    def add(self, key, model, prompt, completion):
+        with self.lock:
+            self.responses[key] = completion
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'key': key, 'model': model, 'prompt': prompt,
+                                    'completion': completion}, ensure_ascii=False) + '\n')
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, body, headers=None):
+        payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self.send_json(200, self.server.snapshot())
+        else:
+            self.send_json(404, {'error': {'type': 'not_found_error', 'message': self.path}})
+
+    def do_POST(self):
+        server = self.server
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if self.path != '/v1/complete':
+            self.send_json(404, {'error': {'type': 'not_found_error', 'message': self.path}})
+            return
+
+        server.count('requests')
+        time.sleep(server.latency())
+
+        roll = random.random()
+        if roll < server.hang_rate:
+            # 클라이언트 읽기 타임아웃 동작 확인용
+            server.count('hangs')
+            time.sleep(server.hang_seconds)
+        elif roll < server.hang_rate + server.error_rate:
+            status = random.choice(server.error_statuses)
+            server.count(f'errors_{status}')
+            headers = {'retry-after': '1'} if status == 429 else None
+            self.send_json(status, {'error': {'type': 'stub_error', 'message': f'synthetic {status}'}}, headers)
+            return
+
+        model = request.get('model', '')
+        prompt = request.get('prompt', '')
+        key = fixture_key(model, prompt)
+        completion = server.fixtures.get(key) if server.mode != 'synthetic' else None
+
+        if completion is not None:
+            server.count('replayed')
+        elif server.mode == 'record':
+            upstream = requests.post(server.upstream + '/v1/complete', json=request, timeout=(3.05, 60), headers={
+                'Content-Type': 'application/json',
+                'X-API-Key': self.headers.get('X-API-Key', ''),
+                'anthropic-version': self.headers.get('anthropic-version', '2023-06-01'),
+            })
+            if upstream.status_code != 200:
+                retry_after = upstream.headers.get('retry-after')
+                self.send_json(upstream.status_code, upstream.json(), {'retry-after': retry_after} if retry_after else None)
+                return
+            completion = upstream.json()['completion']
+            server.fixtures.add(key, model, prompt, completion)
+            server.count('recorded')
+        elif server.strict:
+            server.count('misses')
+            self.send_json(404, {'error': {'type': 'not_found_error', 'message': 'fixture not found'}})
+            return
+        else:
+            completion = synthetic_completion(prompt, request.get('max_tokens_to_sample', 300))
+            server.count('synthetic')
+
+        self.send_json(200, {'completion': completion, 'stop_reason': 'stop_sequence', 'model': model})
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, mode='synthetic', fixtures=None, latency='fixed:0', error_rate=0.0,
+                 error_statuses=(429, 500, 529), hang_rate=0.0, hang_seconds=60.0, strict=False,
+                 upstream=UPSTREAM_URL, verbose=False):
+        super().__init__(address, StubHandler)
+        self.mode = mode
+        self.fixtures = FixtureStore(fixtures)
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.error_statuses = list(error_statuses)
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.strict = strict
+        self.upstream = upstream.rstrip('/')
+        self.verbose = verbose
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+
+    def count(self, name):
+        with self.stats_lock:
+            self.stats[name] = self.stats.get(name, 0) + 1
+
+    def snapshot(self):
+        with self.stats_lock:
+            return dict(self.stats)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+
+# 다른 스크립트(부하 테스트 등)에서 백그라운드 스레드로 띄울 때 사용
+def start_stub(host='127.0.0.1', port=0, **options):
+    server = StubServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='WaterSave 로컬 LLM 대역 서버')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--mode', choices=['synthetic', 'replay', 'record'], default='replay')
+    parser.add_argument('--fixtures', default='llm_fixtures.jsonl')
+    parser.add_argument('--latency', default='fixed:0', help='예: lognormal:-0.5:0.6, uniform:0.2:1.5')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-statuses', default='429,500,529')
+    parser.add_argument('--hang-rate', type=float, default=0.0)
+    parser.add_argument('--hang-seconds', type=float, default=60.0)
+    parser.add_argument('--strict', action='store_true', help='replay 모드에서 픽스처가 없으면 404 반환')
+    parser.add_argument('--upstream', default=UPSTREAM_URL)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    server = StubServer((args.host, args.port), mode=args.mode, fixtures=args.fixtures, latency=args.latency,
+                        error_rate=args.error_rate,
+                        error_statuses=[int(s) for s in args.error_statuses.split(',')],
+                        hang_rate=args.hang_rate, hang_seconds=args.hang_seconds, strict=args.strict,
+                        upstream=args.upstream, verbose=args.verbose)
+    print(f"LLM 대역 서버 실행 중: {server.base_url} (mode={args.mode})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.snapshot(), ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import numpy as np
+from tornado.websocket import websocket_connect
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.Alert_pb2 import Alert
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+import llm_stub
+
+# Streamlit 앱 동시 세션 부하 테스트
+# 앱마다 headless Streamlit 서버를 띄우고, 브라우저 대신 웹소켓 클라이언트 N개가 동시에 접속해
+# 정해진 메뉴 클릭/입력 시나리오를 실행한다. LLM 호출은 llm_stub 서버로 보내므로 네트워크가 필요 없다.
+# 동시 세션 수 단계별로 재실행 지연 백분위수, 세션당 RSS(서버 프로세스 증가분), 오류 수를 보고한다.
+#
+#   python loadtest.py --apps app.py app_api.py watersave-app.py --levels 1 10 50 100 200
+
+TEXT_QUESTION = '샤워할 때 물을 아끼는 방법은?'
+
+# 시나리오 단계: ('load',) / ('click', 라벨) / ('select', 라벨, 옵션) / ('input', 라벨, 값) / ('check', 라벨, 값)
+SCENARIOS = {
+    'app.py': [
+        ('load',),
+        ('click', '누수 검사 실행'),
+        ('click', '공유하기'),
+        ('check', '실시간 모드 (자동 갱신)', True),
+    ],
+    'app_api.py': [
+        ('load',),
+        ('input', 'Claude API 키를 입력하세요:', 'stub-key'),
+        ('check', '실시간 모드 (자동 갱신)', True),
+        ('select', '선택하세요:', 'AI 분석 및 추천'),
+        ('select', '선택하세요:', '게이미피케이션'),
+        ('select', '선택하세요:', '커뮤니티'),
+        ('select', '선택하세요:', '환경 영향 시뮬레이션'),
+        ('select', '선택하세요:', '환경 영향 시각화'),
+        ('select', '선택하세요:', '지능형 어시스턴트'),
+        ('input', '물 절약에 대해 질문해 주세요:', TEXT_QUESTION),
+    ],
+    'watersave-app.py': [
+        ('load',),
+        ('input', '물 절약에 대해 질문해주세요:', TEXT_QUESTION),
+        ('click', '답변 받기'),
+        ('click', '새로운 챌린지 생성'),
+        ('click', '월간 보고서 생성'),
+        ('select', '언어 선택', 'English'),
+    ],
+}
+
+WIDGET_TYPES = {'button', 'checkbox', 'radio', 'selectbox', 'text_input', 'text_area'}
+
+
+class Session:
+    def __init__(self, url, timeout):
+        self.url = url
+        self.timeout = timeout
+        self.ws = None
+        self.widgets = {}        # 라벨 -> 위젯 id
+        self.states = {}         # 위젯 id -> 직렬화된 WidgetState 값 (유지되는 값)
+        self.latencies = []
+        self.exceptions = 0
+        self.error_alerts = 0    # 앱이 try/except로 잡아 st.error로 표시한 오류
+        self.lock_errors = 0
+        self.failures = 0
+
+    async def connect(self):
+        self.ws = await websocket_connect(self.url, subprotocols=['streamlit'])
+
+    def close(self):
+        if self.ws is not None:
+            self.ws.close()
+
+    async def rerun(self, trigger=None):
+        msg = BackMsg()
+        msg.rerun_script.query_string = ''
+        msg.rerun_script.page_script_hash = ''
+        widget_states = msg.rerun_script.widget_states.widgets
+        for widget_id, (field, value) in self.states.items():
+            state = widget_states.add()
+            state.id = widget_id
+            setattr(state, field, value)
+        if trigger is not None:
+            state = widget_states.add()
+            state.id = trigger
+            state.trigger_value = True
+
+        started = time.perf_counter()
+        await self.ws.write_message(msg.SerializeToString(), binary=True)
+        while True:
+            raw = await asyncio.wait_for(self.ws.read_message(), self.timeout)
+            if raw is None:
+                raise ConnectionError('웹소켓 연결이 끊어졌습니다.')
+            forward = ForwardMsg()
+            forward.ParseFromString(raw)
+            kind = forward.WhichOneof('type')
+            if kind == 'delta' and forward.delta.WhichOneof('type') == 'new_element':
+                self._collect(forward.delta.new_element)
+            elif kind == 'script_finished':
+                if forward.script_finished != ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY:
+                    break
+        self.latencies.append(time.perf_counter() - started)
+
+    def _collect(self, element):
+        kind = element.WhichOneof('type')
+        if kind in WIDGET_TYPES:
+            widget = getattr(element, kind)
+            self.widgets[widget.label] = widget.id
+        elif kind == 'exception':
+            self.exceptions += 1
+            if 'database is locked' in element.exception.message:
+                self.lock_errors += 1
+        elif kind == 'alert' and element.alert.format == Alert.ERROR:
+            self.error_alerts += 1
+            if 'database is locked' in element.alert.body:
+                self.lock_errors += 1
+
+    async def step(self, action):
+        kind = action[0]
+        if kind == 'load':
+            await self.rerun()
+            return
+        widget_id = self.widgets.get(action[1])
+        if widget_id is None:
+            raise LookupError(f"위젯을 찾을 수 없습니다: {action[1]}")
+        if kind == 'click':
+            await self.rerun(trigger=widget_id)
+            return
+        field = {'select': 'string_value', 'input': 'string_value', 'check': 'bool_value'}[kind]
+        self.states[widget_id] = (field, action[2])
+        await self.rerun()
+
+
+async def run_session(session, scenario):
+    try:
+        await session.connect()
+        for action in scenario:
+            await session.step(action)
+    except (asyncio.TimeoutError, ConnectionError, LookupError, OSError):
+        session.failures += 1
+
+
+def server_rss(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(app, port, env):
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'streamlit', 'run', app, '--server.headless', 'true',
+         '--server.port', str(port), '--browser.gatherUsageStats', 'false'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/_stcore/health', timeout=1)
+            return process
+        except OSError:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"{app} 서버가 시작되지 않았습니다.")
+
+
+async def run_level(url, pid, scenario, concurrency, timeout):
+    rss_before = server_rss(pid)
+    sessions = [Session(url, timeout) for _ in range(concurrency)]
+    started = time.perf_counter()
+    await asyncio.gather(*(run_session(s, scenario) for s in sessions))
+    elapsed = time.perf_counter() - started
+    # 모든 세션이 연결된 상태에서 측정
+    rss_after = server_rss(pid)
+    for session in sessions:
+        session.close()
+
+    latencies = np.array([l for s in sessions for l in s.latencies]) * 1000
+    result = {
+        'concurrency': concurrency,
+        'reruns': len(latencies),
+        'elapsed_s': round(elapsed, 2),
+        'exceptions': sum(s.exceptions for s in sessions),
+        'error_alerts': sum(s.error_alerts for s in sessions),
+        'lock_errors': sum(s.lock_errors for s in sessions),
+        'failed_sessions': sum(s.failures for s in sessions),
+        'rss_mb': round(rss_after / 2 ** 20, 1) if rss_after else None,
+        'rss_per_session_kb': (round((rss_after - rss_before) / concurrency / 1024, 1)
+                               if rss_after and rss_before else None),
+    }
+    if len(latencies):
+        for p, value in zip((50, 95, 99), np.percentile(latencies, (50, 95, 99))):
+            result[f'p{p}_ms'] = round(float(value), 1)
+    return result
+
+
+def print_table(app, results):
+    print(f"\n== {app} ==")
+    columns = ['concurrency', 'reruns', 'p50_ms', 'p95_ms', 'p99_ms', 'rss_mb', 'rss_per_session_kb',
+               'exceptions', 'error_alerts', 'lock_errors', 'failed_sessions', 'elapsed_s']
+    print(' '.join(f'{c:>18}' for c in columns))
+    for row in results:
+        print(' '.join(f'{str(row.get(c, "-")):>18}' for c in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Streamlit 앱 동시 세션 부하 테스트')
+    parser.add_argument('--apps', nargs='+', default=list(SCENARIOS))
+    parser.add_argument('--levels', nargs='+', type=int, default=[1, 5, 10, 25, 50, 100, 200])
+    parser.add_argument('--db', default='loadtest_water_usage.db')
+    parser.add_argument('--timeout', type=float, default=120, help='재실행 한 번의 최대 대기 시간(초)')
+    parser.add_argument('--llm-latency', default='lognormal:-1:0.5', help='llm_stub 지연 분포')
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--output', help='결과를 JSON 파일로 저장')
+    args = parser.parse_args()
+
+    stub = llm_stub.start_stub(mode='synthetic', latency=args.llm_latency, error_rate=args.llm_error_rate)
+    env = dict(os.environ, DB_FILE=os.path.abspath(args.db), LLM_BASE_URL=stub.base_url,
+               ANTHROPIC_API_KEY='stub-key')
+
+    report = {}
+    for app in args.apps:
+        # 시나리오는 파일 이름으로 찾음 (--apps에 경로를 줘도 됨)
+        scenario = SCENARIOS.get(os.path.basename(app))
+        if scenario is None:
+            raise SystemExit(f"{app}: 시나리오가 없습니다 ({', '.join(SCENARIOS)} 중 하나)")
+        port = free_port()
+        server = start_server(app, port, env)
+        url = f'ws://127.0.0.1:{port}/_stcore/stream'
+        try:
+            # 첫 실행의 모듈 임포트/캐시 생성이 1단계 수치에 섞이지 않도록 한 세션으로 예열
+            asyncio.run(run_session(Session(url, args.timeout), scenario))
+            results = []
+            for level in args.levels:
+                results.append(asyncio.run(run_level(url, server.pid, scenario, level, args.timeout)))
+                print(json.dumps(results[-1], ensure_ascii=False))
+        finally:
+            server.terminate()
+            server.wait()
+        report[app] = results
+        print_table(app, results)
+
+    print(f"\nLLM 대역 서버 호출: {stub.snapshot()}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+import ingest
+
+# 물 사용량 데이터 보존 관리
+# - 계량기(meter_id)별로 집계
+# - 원시(1분) 데이터는 RETENTION_RAW_DAYS 동안만 보관하고, 그 이후는 15분 단위로 집계
+# - 15분 집계는 RETENTION_15M_DAYS 이후 1시간 단위로 다시 집계
+# - 1시간 집계는 RETENTION_1H_DAYS 이후 삭제 (0이면 영구 보관)
+# - 한 번에 COMPACT_CHUNK_ROWS 행씩 짧은 트랜잭션으로 처리해 쓰기 잠금을 오래 잡지 않음
+# - incremental auto-vacuum으로 비워진 페이지를 실제로 반환해 파일 크기를 줄임
+#
+#   python retention.py --enable-incremental-vacuum  # 최초 한 번 (전체 VACUUM, 쓰기를 멈춘 상태에서 실행)
+#   python retention.py --once          # 한 번만 정리
+#   python retention.py --interval 3600 # 한 시간마다 정리
+
+DB_FILE = os.environ.get('DB_FILE', 'water_usage.db')
+
+# 앱의 30일 분석 쿼리가 원시 데이터를 읽으므로 원시 보관 기간은 30일보다 길게 둔다
+RAW_DAYS = int(os.environ.get('RETENTION_RAW_DAYS', '35'))
+ROLLUP_15M_DAYS = int(os.environ.get('RETENTION_15M_DAYS', '180'))
+ROLLUP_1H_DAYS = int(os.environ.get('RETENTION_1H_DAYS', '1095'))
+CHUNK_ROWS = int(os.environ.get('COMPACT_CHUNK_ROWS', '5000'))
+CHUNK_PAUSE = float(os.environ.get('COMPACT_CHUNK_PAUSE', '0.05'))
+VACUUM_PAGES = int(os.environ.get('COMPACT_VACUUM_PAGES', '1000'))
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+BUCKET_15M = ("strftime('%Y-%m-%d %H:', {col}) || "
+              "printf('%02d', CAST(strftime('%M', {col}) AS INTEGER) / 15 * 15) || ':00'")
+BUCKET_1H = "strftime('%Y-%m-%d %H:00:00', {col})"
+
+
+ROLLUP_SCHEMA = '''CREATE TABLE IF NOT EXISTS {table}
+                   (meter_id TEXT, bucket TEXT, usage REAL, samples INTEGER, max_usage REAL,
+                    PRIMARY KEY (meter_id, bucket))'''
+
+
+def ensure_schema(conn):
+    ingest.ensure_schema(conn)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_water_usage_timestamp ON water_usage (timestamp)")
+    for table in ('water_usage_15m', 'water_usage_1h'):
+        ingest.ensure_meter_keyed(conn, table, ROLLUP_SCHEMA)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_bucket ON {table} (bucket)")
+
+
+# auto_vacuum 모드는 VACUUM 이후에만 바뀌므로 최초 한 번만 전체 VACUUM 수행
+# 큰 DB에서는 몇 분 동안 배타 잠금을 잡으므로 백그라운드 작업에서는 호출하지 않고 CLI로만 실행
+def enable_incremental_vacuum(conn):
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+
+
+def incremental_vacuum(conn, pages=VACUUM_PAGES):
+    # INCREMENTAL 모드가 아니면 incremental_vacuum은 아무 일도 하지 않음
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return 0
+    freed = 0
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    while free_pages:
+        # execute()는 한 단계만 실행해 페이지를 하나만 반환하므로 executescript로 끝까지 실행
+        conn.executescript(f"PRAGMA incremental_vacuum({min(free_pages, pages)})")
+        remaining = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if remaining >= free_pages:
+            # 다른 연결이 읽는 중이거나 반환할 수 없는 경우 다음 주기로 미룸
+            break
+        freed += free_pages - remaining
+        free_pages = remaining
+        time.sleep(CHUNK_PAUSE)
+    return freed
+
+
+# 한 청크의 데이터를 src에서 dst로 집계 이동 (dst가 None이면 삭제만)
+def _compact_chunk(conn, src, key, values, dst, bucket_expr, cutoff, chunk_rows):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(f"SELECT {key} FROM {src} WHERE {key} < ? ORDER BY {key} LIMIT 1 OFFSET ?",
+                           (cutoff, chunk_rows - 1)).fetchone()
+        # 청크 경계: 남은 행이 청크보다 적으면 cutoff까지 전부
+        if row is None:
+            where, params = f"{key} < ?", (cutoff,)
+        else:
+            where, params = f"{key} <= ? AND {key} < ?", (row[0], cutoff)
+
+        if dst is not None:
+            conn.execute(f'''INSERT INTO {dst} (meter_id, bucket, usage, samples, max_usage)
+                             SELECT meter_id, {bucket_expr.format(col=key)} AS b, {values}
+                             FROM {src} WHERE {where} GROUP BY meter_id, b
+                             ON CONFLICT(meter_id, bucket) DO UPDATE SET
+                                 usage = usage + excluded.usage,
+                                 samples = samples + excluded.samples,
+                                 max_usage = MAX(max_usage, excluded.max_usage)''', params)
+        moved = conn.execute(f"DELETE FROM {src} WHERE {where}", params).rowcount
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return moved
+
+
+def _compact_table(conn, src, key, values, dst, bucket_expr, days, now, chunk_rows):
+    if days <= 0:
+        return 0
+    cutoff = (now - timedelta(days=days)).strftime(TIME_FORMAT)
+    total = 0
+    while True:
+        moved = _compact_chunk(conn, src, key, values, dst, bucket_expr, cutoff, chunk_rows)
+        total += moved
+        if moved < chunk_rows:
+            return total
+        time.sleep(CHUNK_PAUSE)
+
+
+# 보존 정책을 한 번 적용하고 단계별 처리 행 수를 반환
+def compact(conn, now=None, chunk_rows=CHUNK_ROWS):
+    now = now or datetime.now()
+    ensure_schema(conn)
+    stats = {
+        'raw_to_15m': _compact_table(conn, 'water_usage', 'timestamp', 'SUM(usage), COUNT(*), MAX(usage)',
+                                     'water_usage_15m', BUCKET_15M, RAW_DAYS, now, chunk_rows),
+        '15m_to_1h': _compact_table(conn, 'water_usage_15m', 'bucket', 'SUM(usage), SUM(samples), MAX(max_usage)',
+                                    'water_usage_1h', BUCKET_1H, ROLLUP_15M_DAYS, now, chunk_rows),
+        '1h_expired': _compact_table(conn, 'water_usage_1h', 'bucket', None, None, None,
+                                     ROLLUP_1H_DAYS, now, chunk_rows),
+    }
+    stats['pages_freed'] = incremental_vacuum(conn)
+    return stats
+
+
+def _tick(conn):
+    # INCREMENTAL 모드가 아니면 compact()의 incremental_vacuum은 건너뜀
+    print(f"Compacted: {compact(conn)}")
+
+
+def run_forever(db_file=DB_FILE, interval=3600, stop_event=None):
+    ingest.run_periodically(_tick, db_file, interval, stop_event, autocommit=True, label='데이터 정리')
+
+
+# 데이터 생성기 등 장시간 실행되는 프로세스에서 백그라운드로 정리 작업 실행
+def start_background_compaction(db_file=DB_FILE, interval=3600):
+    return ingest.start_periodic_thread(_tick, db_file, interval, autocommit=True, label='데이터 정리')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='물 사용량 데이터 보존/집계/정리')
+    parser.add_argument('--db', default=DB_FILE)
+    parser.add_argument('--once', action='store_true')
+    parser.add_argument('--interval', type=int, default=3600)
+    parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                        help='auto_vacuum을 INCREMENTAL로 바꾸는 전체 VACUUM을 한 번 실행')
+    args = parser.parse_args()
+
+    if args.enable_incremental_vacuum:
+        conn = ingest.connect(args.db, autocommit=True)
+        enable_incremental_vacuum(conn)
+        print(f"auto_vacuum: {conn.execute('PRAGMA auto_vacuum').fetchone()[0]}")
+        conn.close()
+    elif args.once:
+        conn = ingest.connect(args.db, autocommit=True)
+        print(compact(conn))
+        conn.close()
+    else:
+        run_forever(args.db, args.interval)
+
+
+if __name__ == '__main__':
+    main()
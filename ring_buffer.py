@@ -0,0 +1,240 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import ingest
+
+# 최근 측정값 공유 링 버퍼
+# 프로세스 안의 모든 세션이 같은 최신 데이터를 보므로, 계량기별로 미리 할당한 NumPy 배열
+# (timestamp int64 + usage float64 = 16바이트/분)에 최근 7일을 보관하고 쓰기 커서로 덮어쓴다.
+# 메모리는 계량기당 7 x 1,440 x 16 = 161,280바이트로 고정되며, 최대 RING_BUFFER_METERS개까지 둔다.
+#
+# - 같은 프로세스에서 ingest.insert_readings()로 적재하면 즉시 반영된다.
+# - 다른 프로세스(데이터 생성기 등)의 적재는 프로세스당 하나의 tail 스레드가 rowid 워터마크 이후의
+#   행만 읽어 반영한다 (세션 수와 무관하게 틱마다 작은 증분 쿼리 하나).
+# - 실시간 차트와 오늘 목표 진행률은 SQL이나 DataFrame 없이 이 버퍼에서 바로 계산한다.
+# - 계량기별로 시간 순서를 유지하며, 이미 본 시각보다 오래된 행(과거 데이터 일괄 입력 등)은 무시한다.
+
+CAPACITY = int(os.environ.get('RING_BUFFER_MINUTES', str(7 * 1440)))
+MAX_METERS = int(os.environ.get('RING_BUFFER_METERS', '64'))
+TAIL_INTERVAL = float(os.environ.get('RING_BUFFER_TAIL_SECONDS', '2'))
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def to_epoch(timestamps):
+    return np.asarray(timestamps, dtype='datetime64[s]').astype(np.int64)
+
+
+def now_epoch():
+    return int(to_epoch(datetime.now().strftime(TIME_FORMAT)))
+
+
+class ReadingRing:
+    def __init__(self, capacity=CAPACITY):
+        self.timestamps = np.zeros(capacity, dtype=np.int64)
+        self.usage = np.zeros(capacity, dtype=np.float64)
+        self.capacity = capacity
+        self.cursor = 0
+        self.size = 0
+        self.last = np.iinfo(np.int64).min
+
+    @property
+    def nbytes(self):
+        return self.timestamps.nbytes + self.usage.nbytes
+
+    # 시간 순으로 정렬된 배열을 추가 (마지막 시각 이전의 행은 버림)
+    def extend(self, timestamps, usage):
+        keep = timestamps > self.last
+        timestamps, usage = timestamps[keep], usage[keep]
+        if len(timestamps) == 0:
+            return
+        if len(timestamps) > self.capacity:
+            timestamps, usage = timestamps[-self.capacity:], usage[-self.capacity:]
+        n = len(timestamps)
+        positions = (self.cursor + np.arange(n)) % self.capacity
+        self.timestamps[positions] = timestamps
+        self.usage[positions] = usage
+        self.cursor = (self.cursor + n) % self.capacity
+        self.size = min(self.capacity, self.size + n)
+        self.last = timestamps[-1]
+
+    # since 이후의 (timestamps, usage)를 시간 순으로 반환
+    def since(self, since):
+        start = (self.cursor - self.size) % self.capacity
+        order = (start + np.arange(self.size)) % self.capacity
+        timestamps = self.timestamps[order]
+        first = np.searchsorted(timestamps, since, side='left')
+        return timestamps[first:], self.usage[order[first:]]
+
+
+class RecentReadings:
+    def __init__(self, db_file, capacity=CAPACITY, max_meters=MAX_METERS):
+        self.db_file = db_file
+        self.capacity = capacity
+        self.max_meters = max_meters
+        self.rings = {}
+        self.pending = {}        # 초기 로드 중인 계량기 -> 그동안 publish된 (timestamps, usage)
+        self.lock = threading.Lock()
+        self.load_lock = threading.Lock()
+        self.watermark = None
+        self.tailer = None
+
+    # 계량기를 처음 조회할 때 최근 구간을 SQLite에서 한 번 읽어 채움
+    # 읽는 동안 tailer가 publish한 행은 pending에 모았다가 이어 붙여 그 사이에 커밋된 행을 잃지 않음
+    def _ring(self, meter_id):
+        ring = self.rings.get(meter_id)
+        if ring is not None or len(self.rings) >= self.max_meters:
+            return ring
+        with self.load_lock:
+            ring = self.rings.get(meter_id)
+            if ring is not None:
+                return ring
+            with self.lock:
+                self.pending[meter_id] = ([], [])
+            since = (datetime.now() - timedelta(minutes=self.capacity)).strftime(TIME_FORMAT)
+            try:
+                conn = sqlite3.connect(self.db_file, timeout=30)
+                try:
+                    rows = conn.execute("""SELECT timestamp, usage FROM water_usage
+                                           WHERE meter_id = ? AND timestamp >= ? ORDER BY timestamp""",
+                                        (meter_id, since)).fetchall()
+                finally:
+                    conn.close()
+            except BaseException:
+                with self.lock:
+                    self.pending.pop(meter_id, None)
+                raise
+            ring = ReadingRing(self.capacity)
+            if rows:
+                timestamps, usage = zip(*rows)
+                ring.extend(to_epoch(timestamps), np.array(usage, dtype=np.float64))
+            with self.lock:
+                # 로드와 겹친 행은 extend가 마지막 시각 이하를 버리므로 중복되지 않음
+                timestamps, usage = self.pending.pop(meter_id)
+                if timestamps:
+                    self._extend(ring, timestamps, usage)
+                self.rings[meter_id] = ring
+            return ring
+
+    @staticmethod
+    def _extend(ring, timestamps, usage):
+        timestamps = to_epoch(timestamps)
+        order = np.argsort(timestamps, kind='stable')
+        ring.extend(timestamps[order], np.array(usage, dtype=np.float64)[order])
+
+    # (meter_id, timestamp, usage) 행들을 반영 (버퍼에 없는 계량기는 무시)
+    def publish(self, rows):
+        with self.lock:
+            by_meter = {}
+            for meter_id, timestamp, usage in rows:
+                if meter_id in self.rings or meter_id in self.pending:
+                    by_meter.setdefault(meter_id, ([], []))
+                    by_meter[meter_id][0].append(timestamp)
+                    by_meter[meter_id][1].append(usage)
+            for meter_id, (timestamps, usage) in by_meter.items():
+                if meter_id in self.pending:
+                    self.pending[meter_id][0].extend(timestamps)
+                    self.pending[meter_id][1].extend(usage)
+                else:
+                    self._extend(self.rings[meter_id], timestamps, usage)
+
+    def tail_once(self, conn):
+        if self.watermark is None:
+            self.watermark = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM water_usage").fetchone()[0]
+            return 0
+        rows = conn.execute("""SELECT rowid, meter_id, timestamp, usage FROM water_usage
+                               WHERE rowid > ? ORDER BY rowid""", (self.watermark,)).fetchall()
+        if rows:
+            self.watermark = rows[-1][0]
+            self.publish(row[1:] for row in rows)
+        return len(rows)
+
+    def _tail_forever(self):
+        conn = sqlite3.connect(self.db_file, timeout=30)
+        while True:
+            try:
+                self.tail_once(conn)
+            except sqlite3.Error:
+                pass
+            time.sleep(TAIL_INTERVAL)
+
+    def start_tailer(self):
+        conn = sqlite3.connect(self.db_file, timeout=30)
+        try:
+            ingest.ensure_schema(conn)
+            self.tail_once(conn)
+        finally:
+            conn.close()
+        self.tailer = threading.Thread(target=self._tail_forever, daemon=True)
+        self.tailer.start()
+
+    def window(self, meter_id, seconds):
+        ring = self._ring(meter_id)
+        if ring is None:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        with self.lock:
+            return ring.since(now_epoch() - seconds)
+
+    def latest(self, meter_id):
+        ring = self._ring(meter_id)
+        if ring is None or ring.size == 0:
+            return None
+        with self.lock:
+            position = (ring.cursor - 1) % ring.capacity
+            timestamp = np.datetime64(int(ring.timestamps[position]), 's').astype(datetime)
+            return timestamp.strftime(TIME_FORMAT), float(ring.usage[position])
+
+    # 최근 hours시간의 시간대별 평균 (24칸, 데이터 없는 시간은 NaN)
+    def hourly_average(self, meter_id, hours=24):
+        timestamps, usage = self.window(meter_id, hours * 3600)
+        hour = (timestamps % 86400) // 3600
+        return _average(hour, usage, 24)
+
+    # 최근 days일의 요일별 평균 (7칸, 0=일요일, SQLite strftime('%w')와 같음)
+    def weekday_average(self, meter_id, days=7):
+        timestamps, usage = self.window(meter_id, days * 86400)
+        weekday = (timestamps // 86400 + 4) % 7  # 1970-01-01은 목요일
+        return _average(weekday, usage, 7)
+
+    # 오늘 0시 이후 총 사용량
+    def today_total(self, meter_id):
+        ring = self._ring(meter_id)
+        if ring is None:
+            return 0.0
+        midnight = now_epoch() // 86400 * 86400
+        with self.lock:
+            return float(ring.since(midnight)[1].sum())
+
+
+def _average(bins, usage, size):
+    sums = np.bincount(bins, weights=usage, minlength=size)
+    counts = np.bincount(bins, minlength=size)
+    return np.divide(sums, counts, out=np.full(size, np.nan), where=counts > 0)
+
+
+_buffers = {}
+_buffers_lock = threading.Lock()
+
+
+# 프로세스 전체에서 공유하는 버퍼 (데이터베이스 파일별로 하나, 처음 호출할 때 tail 스레드 시작)
+def get_buffer(db_file=ingest.DB_FILE):
+    db_file = os.path.abspath(db_file)
+    with _buffers_lock:
+        buffer = _buffers.get(db_file)
+        if buffer is None:
+            if not _buffers:
+                ingest.subscribe(_publish)
+            buffer = _buffers[db_file] = RecentReadings(db_file)
+            buffer.start_tailer()
+        return buffer
+
+
+# ingest.insert_readings() 적재 직후 호출됨: 이 프로세스에 해당 파일의 버퍼가 있으면 바로 반영
+def _publish(db_file, rows):
+    buffer = _buffers.get(db_file)
+    if buffer is not None:
+        buffer.publish(rows)
@@ -0,0 +1,176 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+import streamlit as st
+
+import ingest
+
+# 커뮤니티 물 절약 팁 게시판
+# - 팁은 tips 테이블에 저장하고, FTS5 외부 콘텐츠 인덱스(tips_fts)를 트리거로 동기화한다.
+# - 한국어는 조사가 붙어 띄어쓰기 단위 토큰이 길어지므로(예: '샤워를') unicode61 토크나이저에
+#   접두어 검색('샤워'*)과 2~4글자 접두어 인덱스를 사용한다.
+# - 목록/검색은 OFFSET 대신 마지막으로 본 id 기준 키셋 페이지네이션을 사용해 게시판이 커져도 일정하게 빠르다.
+# - 인기 팁 목록은 프로세스 메모리에 캐시하고 글쓰기/추천 시 갱신한다 (다른 프로세스의 쓰기는 TTL 후 반영).
+
+PAGE_SIZE = int(os.environ.get('TIPS_PAGE_SIZE', '10'))
+TOP_N = int(os.environ.get('TIPS_TOP_N', '5'))
+TOP_TTL = float(os.environ.get('TIPS_TOP_TTL', '60'))
+MAX_LENGTH = 1000
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def ensure_schema(conn):
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS tips
+            (id INTEGER PRIMARY KEY, meter_id TEXT, body TEXT NOT NULL, created TEXT,
+             likes INTEGER NOT NULL DEFAULT 0);
+        CREATE INDEX IF NOT EXISTS idx_tips_top ON tips (likes, id);
+        CREATE VIRTUAL TABLE IF NOT EXISTS tips_fts USING fts5
+            (body, content='tips', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3 4');
+        CREATE TRIGGER IF NOT EXISTS tips_ai AFTER INSERT ON tips BEGIN
+            INSERT INTO tips_fts (rowid, body) VALUES (new.id, new.body);
+        END;
+        CREATE TRIGGER IF NOT EXISTS tips_ad AFTER DELETE ON tips BEGIN
+            INSERT INTO tips_fts (tips_fts, rowid, body) VALUES ('delete', old.id, old.body);
+        END;
+        CREATE TRIGGER IF NOT EXISTS tips_au AFTER UPDATE OF body ON tips BEGIN
+            INSERT INTO tips_fts (tips_fts, rowid, body) VALUES ('delete', old.id, old.body);
+            INSERT INTO tips_fts (rowid, body) VALUES (new.id, new.body);
+        END;
+    ''')
+
+
+def connect(db_file=ingest.DB_FILE):
+    conn = ingest.connect(db_file)
+    ensure_schema(conn)
+    return conn
+
+
+# 사용자 입력을 FTS5 질의로 변환: 단어마다 따옴표로 감싸 연산자를 무력화하고 접두어 검색
+def fts_query(text):
+    terms = [term.replace('"', '""') for term in text.split()]
+    return ' '.join(f'"{term}"*' for term in terms if term.strip('"')) or None
+
+
+# (rows, next_cursor) 반환. rows는 (id, body, created, likes), 최신순
+# next_cursor를 다음 호출의 before로 넘기면 다음 페이지 (더 없으면 None)
+def recent_tips(conn, before=None, limit=PAGE_SIZE):
+    rows = conn.execute("""SELECT id, body, created, likes FROM tips
+                           WHERE id < ? ORDER BY id DESC LIMIT ?""",
+                        (before or 2 ** 63 - 1, limit + 1)).fetchall()
+    return _page(rows, limit)
+
+
+def search_tips(conn, text, before=None, limit=PAGE_SIZE):
+    query = fts_query(text)
+    if query is None:
+        return recent_tips(conn, before, limit)
+    rows = conn.execute("""SELECT t.id, t.body, t.created, t.likes
+                           FROM tips_fts JOIN tips t ON t.id = tips_fts.rowid
+                           WHERE tips_fts MATCH ? AND tips_fts.rowid < ?
+                           ORDER BY tips_fts.rowid DESC LIMIT ?""",
+                        (query, before or 2 ** 63 - 1, limit + 1)).fetchall()
+    return _page(rows, limit)
+
+
+def _page(rows, limit):
+    if len(rows) > limit:
+        return rows[:limit], rows[limit - 1][0]
+    return rows, None
+
+
+_top_cache = {}
+_top_lock = threading.Lock()
+
+
+def _db_key(conn):
+    return conn.execute("PRAGMA database_list").fetchone()[2]
+
+
+def _refresh_top(conn):
+    rows = conn.execute("""SELECT id, body, created, likes FROM tips
+                           WHERE likes > 0 ORDER BY likes DESC, id DESC LIMIT ?""", (TOP_N,)).fetchall()
+    with _top_lock:
+        _top_cache[_db_key(conn)] = (time.monotonic() + TOP_TTL, rows)
+    return rows
+
+
+# 추천 수 상위 팁 (캐시)
+def top_tips(conn):
+    with _top_lock:
+        cached = _top_cache.get(_db_key(conn))
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    return _refresh_top(conn)
+
+
+def add_tip(conn, body, meter_id=ingest.DEFAULT_METER):
+    body = body.strip()[:MAX_LENGTH]
+    if not body:
+        raise ValueError('빈 팁은 저장할 수 없습니다.')
+    with conn:
+        tip_id = conn.execute("INSERT INTO tips (meter_id, body, created) VALUES (?, ?, ?)",
+                              (meter_id, body, datetime.now().strftime(TIME_FORMAT))).lastrowid
+    _refresh_top(conn)
+    return tip_id
+
+
+def like_tip(conn, tip_id):
+    with conn:
+        conn.execute("UPDATE tips SET likes = likes + 1 WHERE id = ?", (tip_id,))
+    _refresh_top(conn)
+
+
+def _like(db_file, tip_id):
+    conn = connect(db_file)
+    try:
+        like_tip(conn, tip_id)
+    finally:
+        conn.close()
+
+
+def _show_tips(db_file, rows, prefix):
+    for tip_id, body, created, likes in rows:
+        text_col, like_col = st.columns([5, 1])
+        text_col.write(f"{body}  \n_{created}_")
+        like_col.button(f'👍 {likes}', key=f'{prefix}_like_{tip_id}', on_click=_like, args=(db_file, tip_id))
+
+
+# 팁 공유/검색/인기 팁 화면 (app.py, app_api.py 공용)
+def tip_board(db_file):
+    conn = connect(db_file)
+    try:
+        st.subheader('물 절약 팁 공유')
+        tip = st.text_area('물 절약 팁을 공유해주세요:')
+        if st.button('공유하기'):
+            if tip.strip():
+                add_tip(conn, tip)
+                st.session_state['tips_cursor'] = None
+                st.success('팁이 공유되었습니다. 감사합니다!')
+            else:
+                st.warning('팁 내용을 입력해주세요.')
+
+        top = top_tips(conn)
+        if top:
+            st.write('**인기 팁**')
+            _show_tips(db_file, top, 'top')
+
+        # 검색어가 바뀌면 첫 페이지부터
+        query = st.text_input('팁 검색', key='tips_query')
+        if st.session_state.get('tips_cursor_query') != query:
+            st.session_state['tips_cursor_query'] = query
+            st.session_state['tips_cursor'] = None
+        rows, next_cursor = search_tips(conn, query, st.session_state.get('tips_cursor'))
+        if not rows:
+            st.write('검색 결과가 없습니다.' if query.strip() else '아직 공유된 팁이 없습니다.')
+        _show_tips(db_file, rows, 'list')
+
+        first_col, next_col = st.columns(2)
+        if st.session_state.get('tips_cursor') is not None:
+            first_col.button('처음으로', on_click=st.session_state.__setitem__, args=('tips_cursor', None))
+        if next_cursor is not None:
+            next_col.button('다음 팁', on_click=st.session_state.__setitem__, args=('tips_cursor', next_cursor))
+    finally:
+        conn.close()
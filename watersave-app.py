@@ -5,8 +5,12 @@ import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import sqlite3
 import os
-import requests
 import json
+import llm_client
+import ingest
+import impact_sim
+import end_use
+import features
 
 # 페이지 설정
 st.set_page_config(layout="wide")
@@ -32,10 +36,16 @@ def call_claude_api(prompt):
         "max_tokens_to_sample": 300
     }
     
-    response = requests.post("https://api.anthropic.com/v1/complete", headers=headers, json=data)
+    # 서킷이 열려 있거나 재시도가 모두 실패하면 최근 응답 또는 기본 문구로 대체
+    try:
+        response = llm_client.get_transport().post_json("/v1/complete", headers, data)
+    except llm_client.LLMUnavailable:
+        return llm_client.cached_completion(prompt)
     
     if response.status_code == 200:
-        return response.json()['completion']
+        completion = response.json()['completion']
+        llm_client.remember_completion(prompt, completion)
+        return completion
     else:
         return f"API 호출 오류: {response.status_code}"
 
@@ -47,6 +57,8 @@ def init_db():
     # water_usage 테이블 생성
     c.execute('''CREATE TABLE IF NOT EXISTS water_usage
                  (timestamp TEXT, usage REAL)''')
+    # meter_id 열과 인덱스 (이전 버전 DB 이전 포함)
+    ingest.ensure_schema(conn)
     
     # user_info 테이블 생성
     c.execute('''CREATE TABLE IF NOT EXISTS user_info
@@ -85,26 +97,21 @@ col1, col2 = st.columns(2)
 
 with col1:
     st.subheader('개인 맞춤형 분석')
-    query = """
-    SELECT 
-        AVG(CASE WHEN strftime('%w', timestamp) IN ('0', '6') THEN usage ELSE NULL END) as weekend_avg,
-        AVG(CASE WHEN strftime('%w', timestamp) NOT IN ('0', '6') THEN usage ELSE NULL END) as weekday_avg
-    FROM water_usage
-    WHERE timestamp >= datetime('now', '-30 days')
-    """
     try:
-        usage_data = pd.read_sql_query(query, conn).iloc[0]
-        st.write(f"- 주중 평균: {usage_data['weekday_avg']:.2f}L/시간")
-        st.write(f"- 주말 평균: {usage_data['weekend_avg']:.2f}L/시간")
-        st.write("- 샤워 사용량: 전체의 40% (추정)")
-        st.write("- 세탁 사용량: 전체의 20% (추정)")
+        # 야간 배치로 계산해 둔 가구 특성을 키 조회 한 번으로 읽음
+        usage_data = features.household_features(conn, db_file=DB_FILE)
+        feature_lines = features.describe_features(usage_data)
+        for line in feature_lines or ["사용 패턴: 분석할 데이터가 아직 부족합니다."]:
+            st.write(f"- {line}")
+        # 용도별 분해 결과 테이블에서 실제 비율을 읽음
+        shares = end_use.end_use_shares(conn)
+        for line in end_use.describe_shares(shares) or ["용도별 사용량: 분석할 데이터가 아직 부족합니다."]:
+            st.write(f"- {line}")
         
+        share_lines = "\n        ".join(f"- {line}" for line in feature_lines + end_use.describe_shares(shares))
         prompt = f"""
         사용자의 물 사용 데이터:
-        - 주중 평균: {usage_data['weekday_avg']:.2f}L/시간
-        - 주말 평균: {usage_data['weekend_avg']:.2f}L/시간
-        - 샤워 사용량: 전체의 40% (추정)
-        - 세탁 사용량: 전체의 20% (추정)
+        {share_lines}
 
         위 데이터를 바탕으로 사용자의 물 사용 패턴을 분석하고, 
         물 절약을 위한 3가지 맞춤형 조언을 제공해주세요.
@@ -120,7 +127,7 @@ with col2:
     if st.button("답변 받기"):
         prompt = f"""
         사용자 질문: {user_question}
-        사용자의 최근 30일 평균 물 사용량: {(usage_data['weekday_avg'] + usage_data['weekend_avg']) / 2:.2f}L/일
+        사용자의 최근 30일 평균 물 사용량: {usage_data['daily_mean']:.2f}L/일
 
         위 정보를 바탕으로 사용자에게 맞춤형 물 절약 조언을 제공해주세요.
         """
@@ -142,15 +149,11 @@ with col2:
 with col3:
     st.subheader('맞춤형 절약 챌린지')
     if st.button("새로운 챌린지 생성"):
-        query = """
-        SELECT AVG(usage) as avg_usage
-        FROM water_usage
-        WHERE timestamp >= datetime('now', '-7 days')
-        """
-        recent_avg = pd.read_sql_query(query, conn).iloc[0]['avg_usage']
-        
+        usage_data = features.household_features(conn, db_file=DB_FILE)
+        profile = "\n        ".join(f"- {line}" for line in features.describe_features(usage_data))
         prompt = f"""
-        사용자의 최근 7일 평균 물 사용량: {recent_avg:.2f}L/일
+        사용자의 물 사용 패턴:
+        {profile}
 
         위 정보를 바탕으로 사용자에게 맞춤형 물 절약 챌린지를 제안해주세요. 
         챌린지는 구체적이고 달성 가능해야 하며, 사용자의 현재 사용량을 고려해야 합니다.
@@ -172,21 +175,15 @@ with col1:
 
 with col2:
     st.subheader('환경 영향 시뮬레이션')
-    query = """
-    SELECT SUM(usage) as total_usage
-    FROM water_usage
-    WHERE timestamp >= datetime('now', '-30 days')
-    """
-    monthly_usage = pd.read_sql_query(query, conn).iloc[0]['total_usage']
-
-    prompt = f"""
-    사용자의 최근 30일 총 물 사용량: {monthly_usage:.2f}L
-
-    위 정보를 바탕으로 사용자의 물 사용이 지역 생태계에 미치는 영향과, 
-    만약 10% 물을 절약했을 때의 긍정적인 환경 영향을 시뮬레이션해주세요.
-    """
-    response = call_claude_api(prompt)
-    st.write(response)
+    # LLM 호출 대신 실제 사용량 분포 기반 몬테카를로 시뮬레이션 (10% 안팎 절약 시)
+    daily_mean, daily_std = impact_sim.usage_profile(conn)
+    result = impact_sim.simulate(daily_mean, daily_std, 0.05, 0.15, 10)
+    water = result['water_l']['percentiles']
+    co2 = result['co2_kg']['percentiles']
+    st.write(f"물 사용량을 10% 안팎으로 줄이면 1년간 약 {water[50][0]:,.0f}L, "
+             f"10년간 약 {water[50][-1]:,.0f}L를 절약할 수 있습니다.")
+    st.write(f"- 10년 에너지 절감: {result['energy_kwh']['percentiles'][50][-1]:,.0f}kWh")
+    st.write(f"- 10년 CO2 감축: {co2[50][-1]:,.0f}kg (90% 구간: {co2[5][-1]:,.0f} ~ {co2[95][-1]:,.0f}kg)")
 
 # 6. 스마트홈 연동 (지능형 문제 해결 추가)
 st.header('6. 스마트홈 연동')
@@ -229,11 +226,11 @@ if st.button("월간 보고서 생성"):
     query = """
     SELECT date(timestamp) as date, SUM(usage) as daily_usage
     FROM water_usage
-    WHERE timestamp >= datetime('now', '-30 days')
+    WHERE meter_id = ? AND timestamp >= datetime('now', 'localtime', '-30 days')
     GROUP BY date(timestamp)
     ORDER BY date(timestamp)
     """
-    monthly_data = pd.read_sql_query(query, conn)
+    monthly_data = pd.read_sql_query(query, conn, params=(ingest.DEFAULT_METER,))
     total_usage = monthly_data['daily_usage'].sum()
     avg_usage = monthly_data['daily_usage'].mean()
     max_usage = monthly_data['daily_usage'].max()
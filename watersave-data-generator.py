@@ -1,56 +1,280 @@
+import argparse
+import multiprocessing as mp
+import queue
 import sqlite3
-import random
 import time
 from datetime import datetime, timedelta
 
-# 데이터베이스 연결
-conn = sqlite3.connect('water_usage.db')
-c = conn.cursor()
-
-# 테이블 생성
-c.execute('''CREATE TABLE IF NOT EXISTS water_usage
-             (timestamp TEXT, usage REAL)''')
-
-# 사용자 정보 테이블 생성
-c.execute('''CREATE TABLE IF NOT EXISTS user_info
-             (key TEXT PRIMARY KEY, value TEXT)''')
-
-# 초기 사용자 정보 설정
-c.execute("INSERT OR REPLACE INTO user_info (key, value) VALUES (?, ?)", 
-          ('daily_goal', '200'))
-c.execute("INSERT OR REPLACE INTO user_info (key, value) VALUES (?, ?)", 
-          ('weekly_challenge', '설거지 물 사용량 20% 줄이기'))
-conn.commit()
-
-def generate_data():
-    # 현재 시간
-    now = datetime.now()
-    
-    # 시간에 따른 기본 사용량 (0시~5시: 낮음, 6시~9시: 높음, 10시~15시: 중간, 16시~23시: 높음)
+import numpy as np
+
+import ingest
+import retention
+import end_use
+import goals
+
+# 물 사용량 데이터 생성기 / 부하 시뮬레이터
+# 인자 없이 실행하면 기존처럼 기본 계량기 하나를 1분마다 기록한다.
+# 여러 가구를 여러 프로세스로 나누어 시간 압축 비율로 실행하면 실제 운영 쓰기 부하를 흉내 낼 수 있다.
+#
+#   python watersave-data-generator.py
+#   python watersave-data-generator.py --households 5000 --processes 8 --compression 60 --duration 120 \
+#       --profiles normal=0.7,traveler=0.1,leaky=0.1,burst=0.1
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# 가구 행동 프로필
+# - vacation_prob: 하루에 휴가(부재)를 시작할 확률, vacation_days: 휴가 기간(일)
+# - leak_prob: 지속 누수가 있는 가구일 확률, leak_rate: 누수 유량(L/분)
+# - burst_prob: 1분마다 파열/대량 사용이 시작될 확률, burst_rate: 유량(L/분), burst_minutes: 지속 시간(분)
+PROFILES = {
+    'normal': {'vacation_prob': 0.0, 'leak_prob': 0.0, 'burst_prob': 0.0},
+    'traveler': {'vacation_prob': 0.05, 'vacation_days': (2, 10), 'leak_prob': 0.0, 'burst_prob': 0.0},
+    'leaky': {'vacation_prob': 0.0, 'leak_prob': 1.0, 'leak_rate': (0.05, 0.5), 'burst_prob': 0.0},
+    'burst': {'vacation_prob': 0.0, 'leak_prob': 0.0, 'burst_prob': 0.0005, 'burst_rate': (15, 40),
+              'burst_minutes': (5, 60)},
+}
+
+
+def parse_profiles(spec):
+    weights = {}
+    for item in spec.split(','):
+        name, _, weight = item.partition('=')
+        if name not in PROFILES:
+            raise ValueError(f"알 수 없는 프로필입니다: {name}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+# 시간대/요일별 기본 사용량 (0시~5시: 낮음, 6시~9시: 높음, 10시~15시: 중간, 16시~23시: 높음)
+def base_usage(now, size, rng):
     hour = now.hour
     if 0 <= hour < 6:
-        base_usage = random.uniform(0.1, 0.5)
+        usage = rng.uniform(0.1, 0.5, size)
     elif 6 <= hour < 10 or 16 <= hour < 24:
-        base_usage = random.uniform(1, 3)
+        usage = rng.uniform(1, 3, size)
     else:
-        base_usage = random.uniform(0.5, 1.5)
-    
+        usage = rng.uniform(0.5, 1.5, size)
+
     # 요일에 따른 변동 (주말에는 사용량이 더 많음)
     if now.weekday() >= 5:  # 5: 토요일, 6: 일요일
-        base_usage *= 1.2
-    
+        usage *= 1.2
+
     # 랜덤 노이즈 추가
-    usage = base_usage + random.uniform(-0.1, 0.1)
-    
-    # 음수 방지
-    usage = max(0, usage)
-    
-    return now.strftime('%Y-%m-%d %H:%M:%S'), round(usage, 2)
-
-# 실시간 데이터 생성 및 저장
-while True:
-    timestamp, usage = generate_data()
-    c.execute("INSERT INTO water_usage VALUES (?, ?)", (timestamp, usage))
+    return usage + rng.uniform(-0.1, 0.1, size)
+
+
+# 한 프로세스가 맡은 가구들의 상태 (모두 배열로 보관해 분 단위로 한 번에 계산)
+class Households:
+    def __init__(self, profile_names, rng):
+        self.rng = rng
+        n = len(profile_names)
+        params = [PROFILES[name] for name in profile_names]
+        self.vacation_prob = np.array([p['vacation_prob'] for p in params])
+        self.vacation_days = np.array([p.get('vacation_days', (0, 0)) for p in params])
+        self.burst_prob = np.array([p['burst_prob'] for p in params])
+        self.burst_rate_range = np.array([p.get('burst_rate', (0, 0)) for p in params])
+        self.burst_minutes = np.array([p.get('burst_minutes', (0, 0)) for p in params])
+        leak_range = np.array([p.get('leak_rate', (0, 0)) for p in params])
+        has_leak = rng.random(n) < np.array([p['leak_prob'] for p in params])
+        self.leak_rate = np.where(has_leak, rng.uniform(leak_range[:, 0], leak_range[:, 1]), 0.0)
+        self.vacation_left = np.zeros(n)
+        self.burst_left = np.zeros(n)
+        self.burst_rate = np.zeros(n)
+
+    def readings(self, now):
+        rng = self.rng
+        n = len(self.leak_rate)
+        usage = base_usage(now, n, rng)
+
+        # 자정마다 휴가 시작 여부 결정
+        if now.hour == 0 and now.minute == 0:
+            start = (self.vacation_left <= 0) & (rng.random(n) < self.vacation_prob)
+            days = rng.uniform(self.vacation_days[:, 0], self.vacation_days[:, 1])
+            self.vacation_left = np.where(start, days * 1440, self.vacation_left)
+        away = self.vacation_left > 0
+        usage[away] = 0
+        self.vacation_left -= 1
+
+        start = (self.burst_left <= 0) & (rng.random(n) < self.burst_prob)
+        self.burst_left = np.where(start, rng.uniform(self.burst_minutes[:, 0], self.burst_minutes[:, 1]),
+                                   self.burst_left)
+        self.burst_rate = np.where(start, rng.uniform(self.burst_rate_range[:, 0], self.burst_rate_range[:, 1]),
+                                   self.burst_rate)
+        bursting = self.burst_left > 0
+        usage[bursting] += self.burst_rate[bursting]
+        self.burst_left -= 1
+
+        # 누수는 부재 중에도 계속됨, 음수 방지
+        return np.round(np.maximum(0, usage + self.leak_rate), 2)
+
+
+def run_worker(worker_id, meter_ids, profile_names, options, start_sim, stop_event, counter, results):
+    rng = np.random.default_rng(options['seed'] + worker_id)
+    conn = ingest.connect(options['db'])
+    households = Households(profile_names, rng)
+    compression = options['compression']
+    verbose = len(meter_ids) == 1 and options['processes'] == 1
+    start_real = time.monotonic()
+    next_minute = start_sim
+    latencies, readings, errors = [], 0, 0
+
+    def flush(batch):
+        nonlocal readings, errors
+        started = time.perf_counter()
+        try:
+            ingest.insert_readings(conn, batch)
+        except sqlite3.OperationalError:
+            errors += 1
+            return
+        latencies.append(time.perf_counter() - started)
+        readings += len(batch)
+        with counter.get_lock():
+            counter.value += len(batch)
+
+    def should_stop():
+        return stop_event.is_set() or bool(options['duration'] and
+                                           time.monotonic() - start_real >= options['duration'])
+
+    try:
+        while not should_stop():
+            sim_now = start_sim + timedelta(seconds=(time.monotonic() - start_real) * compression)
+
+            # 과부하로 밀린 분량이 커져도 배치마다 종료 여부를 확인
+            batch = []
+            while next_minute <= sim_now:
+                timestamp = next_minute.strftime(TIME_FORMAT)
+                usage = households.readings(next_minute)
+                batch.extend(zip(meter_ids, [timestamp] * len(meter_ids), usage.tolist()))
+                if verbose:
+                    print(f"Inserted: {timestamp}, {usage[0]}")
+                next_minute += timedelta(minutes=1)
+                if len(batch) >= options['batch_size']:
+                    flush(batch)
+                    batch = []
+                    if should_stop():
+                        break
+            if batch:
+                flush(batch)
+
+            # 다음 모의 1분이 될 때까지 대기 (최대 1초 단위로 깨어나 종료 여부 확인)
+            wait = (next_minute - sim_now).total_seconds() / compression
+            stop_event.wait(min(max(wait, 0.01), 1.0))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        conn.close()
+        results.put({'readings': readings, 'errors': errors, 'latencies': latencies})
+
+
+# 작업자 결과를 모음 (결과를 남기지 못하고 죽은 작업자는 기다리지 않음)
+def collect_results(results, processes, collected, on_tick=None):
+    while len(collected) < len(processes):
+        try:
+            collected.append(results.get(timeout=1))
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                break
+        if on_tick:
+            on_tick()
+    return collected
+
+
+def report(results, elapsed):
+    readings = sum(r['readings'] for r in results)
+    errors = sum(r['errors'] for r in results)
+    latencies = np.concatenate([r['latencies'] for r in results if r['latencies']] or [[]]) * 1000
+    print(f"총 적재: {readings:,}건 / {elapsed:.1f}초 = {readings / max(elapsed, 1e-9):,.0f} readings/sec")
+    print(f"쓰기 오류(잠금 등): {errors}건, 배치 수: {len(latencies):,}")
+    if len(latencies):
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        print(f"배치 쓰기 지연(ms): p50={p50:.1f} p95={p95:.1f} p99={p99:.1f} max={latencies.max():.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='물 사용량 데이터 생성기 / 다가구 부하 시뮬레이터')
+    parser.add_argument('--db', default=ingest.DB_FILE)
+    parser.add_argument('--households', type=int, default=1)
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--compression', type=float, default=1.0, help='실제 1초당 모의 시간(초)')
+    parser.add_argument('--duration', type=float, default=0, help='실행 시간(초), 0이면 중단할 때까지')
+    parser.add_argument('--start', help='모의 시작 시각 (예: 2024-01-01 00:00:00), 기본값은 현재')
+    parser.add_argument('--profiles', default='normal=1', help='예: normal=0.7,traveler=0.1,leaky=0.1,burst=0.1')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-maintenance', action='store_true', help='보존 정리/용도별 분해 작업을 실행하지 않음')
+    args = parser.parse_args()
+
+    # 데이터베이스 및 사용자 정보 초기화
+    conn = ingest.connect(args.db)
+    ingest.ensure_schema(conn)
+    conn.execute('''CREATE TABLE IF NOT EXISTS user_info
+                    (key TEXT PRIMARY KEY, value TEXT)''')
+    conn.execute("INSERT OR REPLACE INTO user_info (key, value) VALUES (?, ?)",
+                 ('daily_goal', '200'))
+    conn.execute("INSERT OR REPLACE INTO user_info (key, value) VALUES (?, ?)",
+                 ('weekly_challenge', '설거지 물 사용량 20% 줄이기'))
     conn.commit()
-    print(f"Inserted: {timestamp}, {usage}")
-    time.sleep(60)  # 1분마다 데이터 생성
\ No newline at end of file
+    conn.close()
+
+    if args.households == 1:
+        meter_ids = [ingest.DEFAULT_METER]
+    else:
+        meter_ids = [f'meter-{i:06d}' for i in range(args.households)]
+    weights = parse_profiles(args.profiles)
+    rng = np.random.default_rng(args.seed)
+    names = list(weights)
+    probs = np.array([weights[name] for name in names])
+    assigned = rng.choice(names, size=len(meter_ids), p=probs / probs.sum())
+
+    start = datetime.strptime(args.start, TIME_FORMAT) if args.start else datetime.now()
+    start_sim = start.replace(second=0, microsecond=0) + timedelta(minutes=1 if not args.start else 0)
+    options = {'db': args.db, 'compression': args.compression, 'duration': args.duration,
+               'batch_size': args.batch_size, 'seed': args.seed, 'processes': args.processes}
+
+    ctx = mp.get_context('spawn')
+    stop_event = ctx.Event()
+    counter = ctx.Value('q', 0)
+    results = ctx.Queue()
+    processes = []
+    for worker_id, chunk in enumerate(np.array_split(np.arange(len(meter_ids)), args.processes)):
+        if len(chunk) == 0:
+            continue
+        process = ctx.Process(target=run_worker, args=(
+            worker_id, [meter_ids[i] for i in chunk], [str(assigned[i]) for i in chunk], options,
+            start_sim, stop_event, counter, results))
+        process.start()
+        processes.append(process)
+
+    if not args.no_maintenance:
+        # 보존 정책에 따른 집계/정리 작업을 백그라운드로 실행
+        retention.start_background_compaction(args.db)
+        # 새 측정값을 용도별(샤워/세탁/변기/누수 등)로 증분 분해
+        end_use.start_background_disaggregation(args.db)
+        # 모든 가구의 목표/챌린지/사용량 경고를 주기적으로 평가해 알림 저장
+        goals.start_background_scheduler(args.db)
+
+    started = time.monotonic()
+    collected = []
+    last_progress = started
+
+    def progress():
+        nonlocal last_progress
+        if args.households > 1 and time.monotonic() - last_progress >= 5:
+            last_progress = time.monotonic()
+            print(f"[{last_progress - started:.0f}s] 적재 {counter.value:,}건")
+
+    try:
+        collect_results(results, processes, collected, progress)
+    except KeyboardInterrupt:
+        stop_event.set()
+        collect_results(results, processes, collected)
+
+    for process in processes:
+        process.join()
+    if len(collected) < len(processes):
+        print(f"결과 없이 종료된 작업자: {len(processes) - len(collected)}개")
+    report(collected, time.monotonic() - started)
+
+
+if __name__ == '__main__':
+    main()